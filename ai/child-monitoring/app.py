@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from compression import CompressionMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional, AsyncGenerator
 import json
@@ -62,6 +63,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Chat streams are flushed per event, plain JSON replies above the threshold are compressed whole
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")))
+
 # Initialize the main LLM for final response generation
 api_key = os.getenv("OPENAI_API_KEY")
 main_llm = ChatOpenAI(
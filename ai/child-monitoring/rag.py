@@ -7,6 +7,7 @@ from intent_classifier import IntentClassifier
 from pydantic import SecretStr
 
 from langchain_openai import OpenAIEmbeddings
+from embedding_cache import cached_embeddings
 from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
@@ -40,9 +41,13 @@ class ChildMonitoringRAG:
         self.backend_api_base_url = backend_api_base_url
 
         api_key = os.getenv("OPENAI_API_KEY")
-        self.embeddings = OpenAIEmbeddings(
+        # Embeddings are cached on disk, rebuilds and repeated questions skip the API
+        self.embeddings = cached_embeddings(
+            OpenAIEmbeddings(
+                model=self.embedding_model_name,
+                api_key=SecretStr(api_key) if api_key else None,
+            ),
             model=self.embedding_model_name,
-            api_key=SecretStr(api_key) if api_key else None,
         )
 
         self.vectorstore = None
@@ -179,66 +184,61 @@ class ChildMonitoringRAG:
             Pastikan seluruh respons terasa seperti sedang berbicara langsung dengan orang tua/guru, bukan laporan formal.
         """
 
-    def make_backend_api_call(self, api_details: dict, token: str) -> dict[str, str]:
+    def make_backend_api_call(self, api_details: list, token: str) -> list:
         """
-        Makes API calls to the backend based on the classified intent's details.
-        Handles multiple API types if present in api_details['api_type'].
-        Returns a dictionary mapping API type to its JSON response string.
+        Makes a single batched API call to the backend based on the classified intent's details.
+        Every api_call_details entry becomes one metric spec, so the backend answers
+        all of them from one round trip and one pass over the child's books.
+        Returns a list with the JSON response string of each requested metric, or
+        the backend's error payload when it rejects the request (4xx).
         """
+        if isinstance(api_details, dict):
+            api_details = [api_details]
 
-        results = []
+        metrics = []
         for api_detail in api_details:
-            url = self.backend_api_base_url
             api_type = api_detail.get("api_type")
-            url += f"/{api_type}"
+            if not api_type:
+                continue
 
-            # Params
-            params_str = ""
+            metric = {"api_type": api_type}
 
             # Themes
             if api_type == "concept-performance":
-                themes = api_detail.get("themes")
+                themes = api_detail.get("themes") or []
                 if len(themes) > 0:
-                    themes_str = ",".join(themes)
-                    params_str += f"themes={themes_str}&"
-
-            # Time Unit
-            time_unit = api_detail.get("time_unit")
-            if time_unit:
-                params_str += f"time_unit={time_unit}&"
-
-            # Num Periods
-            num_periods = api_detail.get("num_periods")
-            if num_periods:
-                params_str += f"num_periods={num_periods}&"
-
-            # Start Date
-            start_date = api_detail.get("start_date")
-            if start_date:
-                params_str += f"start_date={start_date}&"
-
-            # Start Date
-            end_date = api_detail.get("end_date")
-            if end_date:
-                params_str += f"end_date={end_date}&"
-
-            if params_str != "":
-                url += f"?{params_str}"
-                url = url[:-1]
-
-            print(f"Trying to call URL: {url}")
-            header = {
-                "Authorization": f"Bearer {token}" if token else "",
-            }
-            # Call the backend
-            response = requests.get(
-                url=url,
-                headers=header,
-            )
-            results.append(response.content)
-        
-        return results
-        
+                    metric["themes"] = themes
+
+            # Time filters
+            for param in ["time_unit", "num_periods", "start_date", "end_date"]:
+                value = api_detail.get(param)
+                if value:
+                    metric[param] = value
+
+            metrics.append(metric)
+
+        if not metrics:
+            return []
+
+        url = f"{self.backend_api_base_url}/batch"
+        print(f"Trying to call URL: {url} with {len(metrics)} metrics")
+        header = {
+            "Authorization": f"Bearer {token}" if token else "",
+        }
+        # Call the backend
+        response = requests.post(
+            url=url,
+            headers=header,
+            json={"metrics": metrics},
+        )
+        # 4xx bodies like "User doesn't have any books" are context the LLM can explain
+        # to the parent, only server errors are failures
+        if 400 <= response.status_code < 500:
+            return [response.text]
+        response.raise_for_status()
+
+        return [json.dumps(item, default=str) for item in response.json().get("data", [])]
+
     def create_prompt(self, query: str, child_age: int, token: str) -> PromptValue:
         """
         Creates a formatted prompt for the LLM, combining children's data context and RAG context.
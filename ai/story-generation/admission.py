@@ -0,0 +1,89 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue.
+
+    At most `max_concurrent` requests run at once and at most `max_queue`
+    more wait for a slot. Anything beyond that is rejected right away with
+    503 and Retry-After, instead of piling up behind slow LLM calls until
+    clients time out.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, retry_after: int = 10):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._active = 0
+        self._waiting = 0
+
+    def check(self):
+        """Raise 503 when neither a slot nor a queue place is free"""
+        if self._active + self._waiting >= self.max_concurrent + self.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Story generation is at capacity, please retry later",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+    @asynccontextmanager
+    async def admit(self):
+        self.check()
+
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def queue(self, keepalive: float):
+        """
+        Wait for a slot like admit(), but yield every `keepalive` seconds while
+        queued so a streaming caller can send keep-alives. Once the iteration
+        ends the slot is held and must be given back with release().
+        """
+        self.check()
+
+        self._waiting += 1
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        admitted = False
+        try:
+            while not admitted:
+                # asyncio.wait doesn't cancel the acquire on timeout, the queue place is kept
+                done, _ = await asyncio.wait({acquire}, timeout=keepalive)
+                if done:
+                    acquire.result()
+                    admitted = True
+                else:
+                    yield
+        finally:
+            self._waiting -= 1
+            if admitted:
+                self._active += 1
+            elif acquire.done() and not acquire.cancelled() and acquire.exception() is None:
+                # Got the slot just as the caller went away
+                self._semaphore.release()
+            else:
+                acquire.cancel()
+
+    def release(self):
+        self._active -= 1
+        self._semaphore.release()
+
+    def status(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+        }
@@ -3,13 +3,20 @@ from pydantic import BaseModel
 from typing import Optional, List
 import uvicorn
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 import json
 from rag import FinancialLiteracyRAG
 from langchain_openai import ChatOpenAI
+from openai import LengthFinishReasonError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from compression import CompressionMiddleware
+from admission import AdmissionController
+from story_stream import IncrementalStoryParser, sse_event
+from story_json import StoryJSONError, broken_fragments, complete_scene_count, parse_story_json, splice_fragments
 from dotenv import load_dotenv
+from contextlib import aclosing
 import os
 
 load_dotenv()
@@ -18,7 +25,7 @@ load_dotenv()
 class StoryRequest(BaseModel):
     query: str = Field(..., description="Story request in Indonesian", example="Cerita tentang menabung")
     user_id: str = Field(..., example="user123")
-    age: int = Field(..., example=7, description="Age of the child")
+    age: int = Field(..., ge=4, le=12, example=7, description="Age of the child, 4 to 12")
 
 # Response models
 class Character(BaseModel):
@@ -80,12 +87,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Stories are large JSON documents, compress them for mobile clients
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")))
+
 # Initialize your RAG system
 rag = FinancialLiteracyRAG(
     data_dir='./knowledge_base',
     persist_directory='./chroma_db'
 )
-rag.initialize_rag(rebuild=True)
+rag.initialize_rag()
 
 chat_model = ChatOpenAI(
     model="gpt-4o", 
@@ -93,6 +103,36 @@ chat_model = ChatOpenAI(
     openai_api_key=os.getenv("OPENAI_API_KEY"),
 )
 
+# JSON-schema mode generated from StoryResponse, not strict because story_flow/user_story are free-form
+story_model = chat_model.bind(response_format={
+    "type": "json_schema",
+    "json_schema": {
+        "name": "story",
+        "schema": StoryResponse.model_json_schema(),
+        "strict": False,
+    },
+})
+
+# Cheap model that only re-writes the fragments the local repair couldn't fix
+fixup_model = ChatOpenAI(
+    model=os.getenv("STORY_FIXUP_MODEL", "gpt-4o-mini"),
+    temperature=0,
+    openai_api_key=os.getenv("OPENAI_API_KEY"),
+).bind(response_format={"type": "json_object"})
+
+FIXUP_PROMPT = """The following JSON fragments of a children's story are malformed.
+Fix the JSON syntax of each fragment without changing its content or language.
+Return a JSON object of the form {{"fragments": {{"<label>": <fixed value>}}}} with the same labels.
+
+{fragments}"""
+
+# Generations run concurrently on the async LLM client, bounded so a burst gets 503 instead of timeouts
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("GENERATION_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("GENERATION_MAX_QUEUE", "16")),
+)
+STREAM_KEEPALIVE_INTERVAL = float(os.getenv("STREAM_KEEPALIVE_INTERVAL", "15"))
+
 def convert_age_to_range(age: int) -> str:
     """Convert single age to age range format for RAG system"""
     if age <= 5:
@@ -139,6 +179,9 @@ def validate_story_content(story_data: dict, user_id: str, age: int):
                 story_data[field] = age
             else:
                 story_data[field] = default_value
+
+    # Not part of the prompt, always the requesting user's id
+    story_data["user_id"] = user_id
     
     # 2. Ensure story_flow structure exists and is populated correctly
     if "story_flow" not in story_data:
@@ -257,7 +300,24 @@ def validate_story_content(story_data: dict, user_id: str, age: int):
     story_data["story_flow"]["decision_point"] = decision_points
     story_data["story_flow"]["ending"] = endings
     
-    # 6. Validate characters structure
+    # 6. Every scene link must lead to an existing scene, and the story must be able to end
+    scene_ids = {scene["scene_id"] for scene in scenes}
+    dead_ends = []
+    for scene in scenes:
+        if scene["type"] == "narrative":
+            targets = [scene.get("next_scene")]
+        elif scene["type"] == "decision_point":
+            targets = [choice.get("next_scene") for choice in scene["branch"]]
+        else:
+            targets = []
+        dead_ends.extend(f"{scene['scene_id']} -> {target}" for target in targets if target not in scene_ids)
+
+    if dead_ends:
+        raise HTTPException(status_code=500, detail=f"Story links to missing scenes: {', '.join(dead_ends)}")
+    if not endings:
+        raise HTTPException(status_code=500, detail="Story has no ending scene")
+
+    # 7. Validate characters structure
     characters = story_data.get("characters", [])
     for character in characters:
         if "name" not in character:
@@ -265,7 +325,7 @@ def validate_story_content(story_data: dict, user_id: str, age: int):
         if "description" not in character:
             character["description"] = "A character in the story"
     
-    # 7. Ensure maximum_point is an integer
+    # 8. Ensure maximum_point is an integer
     if not isinstance(story_data.get("maximum_point"), int):
         # Calculate maximum point from all positive points in choices
         max_points = 0
@@ -281,19 +341,22 @@ def validate_story_content(story_data: dict, user_id: str, age: int):
 
 @app.post("/generate-story", response_model=StoryResponse)
 async def generate_story(request: StoryRequest):
+    async with admission.admit():
+        return await _generate_story(request)
+
+async def _generate_story(request: StoryRequest):
     try:
         # Create prompt using your RAG system - convert age to range for RAG
-        prompt = rag.create_prompt(
+        prompt = await rag.acreate_prompt(
             query=request.query,
-            user_id=request.user_id,
             age=request.age,
         )
         
         # Get response from LLM
-        response = chat_model.invoke(prompt)
+        content, truncated = await invoke_story_model(prompt)
         
         # Clean and parse JSON
-        story_json = clean_json_response(response.content)
+        story_json = await parse_story_response(content, truncated)
         
         # Validate and standardize the story content
         story_json = validate_story_content(story_json, request.user_id, request.age)
@@ -304,23 +367,122 @@ async def generate_story(request: StoryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Story generation failed: {str(e)}")
 
-def clean_json_response(content: str) -> dict:
-    """Clean and parse JSON from LLM response"""
-    import re
-    
-    # Remove markdown formatting
-    if "```json" in content:
-        content = re.search(r'```json\n(.*?)\n```', content, re.DOTALL).group(1)
-    
+@app.post("/generate-story/stream")
+async def generate_story_stream(request: StoryRequest):
+    """
+    Stream the story as SSE while the LLM writes it.
+
+    Events: "cover" (cover_img_description), "characters", one "scene" per
+    scene as soon as it is complete, then "complete" with the validated story
+    (same body as /generate-story) or "error". While the request waits for a
+    generation slot, ": ping" comments are sent every STREAM_KEEPALIVE_INTERVAL.
+    """
+    # Reject before the stream starts, a 503 can't be sent once it has
+    admission.check()
+    return StreamingResponse(
+        _stream_story(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+async def _stream_story(request: StoryRequest):
+    try:
+        # Keep-alive comments while queued, the caller's read timeout is shorter than a full queue
+        async with aclosing(admission.queue(keepalive=STREAM_KEEPALIVE_INTERVAL)) as queued:
+            async for _ in queued:
+                yield ": ping\n\n"
+
+        try:
+            prompt = await rag.acreate_prompt(
+                query=request.query,
+                age=request.age,
+            )
+
+            parser = IncrementalStoryParser()
+            truncated = False
+            try:
+                async for chunk in story_model.astream(prompt):
+                    for event, data in parser.feed(chunk.content):
+                        yield sse_event(event, data)
+            except LengthFinishReasonError:
+                # Cut off at max tokens, repair what was streamed so far
+                print(f"Story for user {request.user_id} hit the token limit, repairing the truncated output")
+                truncated = True
+
+            story_json = await parse_story_response(parser.text, truncated)
+            story_json = validate_story_content(story_json, request.user_id, request.age)
+
+            print(f"Streamed story for user {request.user_id} with age {request.age}: {story_json['title']}")
+            yield sse_event("complete", StoryResponse(**story_json).model_dump())
+        finally:
+            admission.release()
+
+    except HTTPException as e:
+        yield sse_event("error", {
+            "detail": e.detail,
+            "status_code": e.status_code,
+            "retry_after": (e.headers or {}).get("Retry-After"),
+        })
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Story generation failed: {str(e)}"})
+
+async def invoke_story_model(prompt) -> Tuple[str, bool]:
+    """
+    Story text from the schema-constrained model and whether it was cut off.
+
+    With a response_format the OpenAI parse helper raises instead of
+    returning when the output hit max tokens, the truncated text is taken
+    from the error so parse_story_response can still repair it.
+    """
     try:
-        return json.loads(content)
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
+        response = await story_model.ainvoke(prompt)
+        return response.content, False
+    except LengthFinishReasonError as e:
+        print("Story hit the token limit, repairing the truncated output")
+        return e.completion.choices[0].message.content or "", True
+
+async def parse_story_response(content: str, truncated: bool = False) -> dict:
+    """
+    Parse the story from the LLM response.
+
+    Almost-valid output is repaired locally. If that is not enough, the
+    broken fragments (a single scene, the characters, ...) are sent in one
+    fix-up call and spliced back, instead of regenerating the whole story.
+
+    Output cut off at max tokens loses the scene it stopped in, whatever
+    links to it is then rejected by validate_story_content.
+    """
+    story = await _parse_story_response(content)
+    if truncated and isinstance(story.get("scene"), list):
+        story["scene"] = story["scene"][:complete_scene_count(content)]
+    return story
+
+async def _parse_story_response(content: str) -> dict:
+    try:
+        return parse_story_json(content)
+    except StoryJSONError as e:
+        text, error = e.text, e.error
+
+    try:
+        spans = broken_fragments(text)
+        if spans:
+            print(f"Repairing story fragments {list(spans)}: {error}")
+            fragments = {label: text[start:end + 1] for label, (start, end) in spans.items()}
+            response = await fixup_model.ainvoke(
+                FIXUP_PROMPT.format(fragments=json.dumps(fragments, ensure_ascii=False, indent=2))
+            )
+            fixed = json.loads(response.content).get("fragments", {})
+            return parse_story_json(splice_fragments(text, spans, fixed))
+    except (ValueError, AttributeError) as e:
+        # StoryJSONError and JSONDecodeError are ValueErrors
+        error = e
+
+    raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(error)}")
 
 # Health check endpoint
 @app.get("/")
 async def root():
-    return {"message": "Indonesian Financial Literacy API is running!"}
+    return {"message": "Indonesian Financial Literacy API is running!", "generation": admission.status()}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+from cachetools import LRUCache
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+
+class TieredByteStore(ByteStore):
+    """
+    Byte store with an in-memory LRU tier in front of a persistent store.
+
+    Hot embeddings (repeated queries, chunks re-read on rebuild) are served
+    from memory, everything is also written through to disk so the cache
+    survives restarts and rebuilds.
+    """
+
+    def __init__(self, store: ByteStore, memory_size: int = 2048):
+        self.store = store
+        self.memory = LRUCache(maxsize=memory_size)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        values = [self.memory.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if missing:
+            for index, value in zip(missing, self.store.mget([keys[index] for index in missing])):
+                if value is not None:
+                    self.memory[keys[index]] = value
+                    values[index] = value
+        return values
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        self.store.mset(key_value_pairs)
+        for key, value in key_value_pairs:
+            self.memory[key] = value
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        self.store.mdelete(keys)
+        for key in keys:
+            self.memory.pop(key, None)
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        yield from self.store.yield_keys(prefix=prefix)
+
+
+def cached_embeddings(
+    embeddings: Embeddings,
+    model: str,
+    cache_dir: str = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache"),
+    memory_size: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048")),
+) -> CacheBackedEmbeddings:
+    """
+    Wrap embeddings with a cache keyed by (model, sha256 of the text).
+
+    Used for both documents and queries, so a chunk embedded on a previous
+    build or a query asked before never goes to the embedding API again.
+    """
+    store = TieredByteStore(LocalFileStore(cache_dir), memory_size=memory_size)
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        store,
+        namespace=model,
+        query_embedding_cache=True,
+        key_encoder="sha256",
+    )
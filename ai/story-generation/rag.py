@@ -1,14 +1,85 @@
 import os
+import math
 import shutil
+import hashlib
+import glob
+import re
+import asyncio
+from cachetools import TTLCache
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import DirectoryLoader
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
+from embedding_cache import cached_embeddings
 from langchain.prompts import ChatPromptTemplate
 import json
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env file
 
+INGEST_MANIFEST = "ingest_manifest.json"
+CHUNK_OVERLAP = 100
+# Bumped when add_metadata changes, stored chunks must then be re-ingested
+METADATA_VERSION = 2
+
+# Retrieval buckets in priority order with how many documents each may contribute
+PRIORITY_BUCKETS = [
+    ("age_exact", 3),  # Financial concepts for the child's age
+    ("core_concepts", 2),  # Financial core concepts
+    ("cultural_story", 2),  # Cultural elements and stories (universal content)
+    ("other", None),  # Fill remaining
+]
+
+# Ages stories are generated for, the per-age prompt section is built once for each
+SUPPORTED_AGES = range(4, 13)
+
+STATIC_INSTRUCTIONS = """You are an expert Indonesian storyteller specializing in teaching financial literacy to children.
+
+Generate a JSON-formatted interactive story in **Bahasa Indonesia** for a child of the age given below, with:
+- Indonesian character names and culturally relevant settings (e.g., warung, pasar)
+- Age-appropriate financial literacy lessons (saving, budgeting, honesty, etc.)
+- Two decision points (unless otherwise noted), each with two choices, that affect the story ending
+
+### General Instructions:
+1. Use simple and engaging Indonesian suitable for the child's age
+2. Scene types must be: "narrative", "decision_point", or "ending"
+3. Choices should lead to consequences that are constructive but realistic
+4. Provide at least two different endings with different moral outcomes
+5. Do not include markdown or explanations—just clean JSON
+6. For higher age groups (11 - 12), the decision points can be more like a quiz to test their understanding for the said concept.
+For example: "Apa itu pegadaian ?"
+"""
+
+AGE_SECTION = """
+### Child Age:
+{age}
+
+### Story Structure Instructions:
+{structure_rules}
+
+### Format:
+{output_format}
+"""
+
+VARIABLE_SECTION = """
+You can use the following context to inform your story, but you are not limited to it. Feel free to create engaging and educational content based on the query provided.
+### Context:
+{context}
+
+### Query:
+{query}
+"""
+
+def l2_relevance(distance):
+    """
+    Relevance in [0, 1] from Chroma's default l2 distance between unit-length
+    (OpenAI) embeddings, the same scale as similarity_score_threshold
+    """
+    return 1.0 - distance / math.sqrt(2)
+
+
+# Compiled once, the per-age section is passed in already formatted
+STORY_PROMPT = ChatPromptTemplate.from_template(STATIC_INSTRUCTIONS + "{age_section}" + VARIABLE_SECTION)
+
 
 class FinancialLiteracyRAG:
     def __init__(
@@ -21,13 +92,22 @@ class FinancialLiteracyRAG:
         self.persist_directory = persist_directory
         self.model = model
 
-        # Initialize components
-        self.embeddings = OpenAIEmbeddings(
+        # Initialize components, embeddings are cached on disk across builds and queries
+        self.embeddings = cached_embeddings(
+            OpenAIEmbeddings(
+                model=model,
+                openai_api_key=os.getenv("OPENAI_API_KEY", "your_openai_api_key_here"),
+            ),
             model=model,
-            openai_api_key=os.getenv("OPENAI_API_KEY", "your_openai_api_key_here"),
         )
-        self.vectorstore = None
-        self.retriever = None
+        self.vector_store = None
+        self.top_k = 10
+
+        # Prioritised context per (normalised query, age), cleared whenever the index changes
+        self.retrieval_cache = TTLCache(
+            maxsize=int(os.getenv("RETRIEVAL_CACHE_MAXSIZE", "512")),
+            ttl=int(os.getenv("RETRIEVAL_CACHE_TTL", "3600")),
+        )
 
     def add_metadata(self, documents):
         for doc in documents:
@@ -56,44 +136,124 @@ class FinancialLiteracyRAG:
             elif "stories" in file_path:
                 doc.metadata["content_type"] = "story"
 
-    def setup_vector_store(self, documents, top_k: int = 10, chunk_size: int = 600):
+            if "core_concepts" in file_path:
+                doc.metadata["category"] = "core_concepts"
+
+    def setup_vector_store(self, top_k: int = 10, chunk_size: int = 600):
         """
-        Create vector store and set up retriever
+        Bring the persisted vector store in line with the knowledge base.
+
+        Each markdown file is fingerprinted by content, unchanged files are not
+        even loaded. Changed files are re-split and only chunks whose content
+        hash is new are embedded; chunks that disappeared, and every chunk of a
+        deleted file, are removed from the store. The file and chunk hashes
+        are kept in a manifest next to the store.
         """
-        # Add metadata to documents
-        self.add_metadata(documents)
+        config = {
+            "model": self.model,
+            "chunk_size": chunk_size,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "metadata_version": METADATA_VERSION,
+        }
+        manifest = self.load_manifest()
+
+        # No manifest (store built before incremental ingest) or other settings, start over
+        if manifest is None or manifest.get("config") != config:
+            print("Vector store manifest missing or outdated, rebuilding from scratch")
+            shutil.rmtree(self.persist_directory, ignore_errors=True)
+            manifest = {"config": config, "files": {}}
+
+        self.vector_store = Chroma(
+            persist_directory=self.persist_directory,
+            embedding_function=self.embeddings,
+        )
+
+        files = manifest["files"]
+        fingerprints = self.fingerprint_files()
+        removed = [path for path in files if path not in fingerprints]
+        changed = [path for path, digest in fingerprints.items() if files.get(path, {}).get("hash") != digest]
+
+        ids_to_delete = []
+        chunks_to_add = []
+        for path in removed:
+            ids_to_delete.extend(files.pop(path)["chunk_ids"])
+
+        for path in changed:
+            documents = self.load_documents(glob_pattern=path)
+            self.add_metadata(documents)
+            chunks = {chunk.metadata["chunk_id"]: chunk for chunk in self.split_documents(documents, path, chunk_size)}
+
+            old_ids = set(files.get(path, {}).get("chunk_ids", []))
+            ids_to_delete.extend(chunk_id for chunk_id in old_ids if chunk_id not in chunks)
+            chunks_to_add.extend(chunk for chunk_id, chunk in chunks.items() if chunk_id not in old_ids)
+            files[path] = {"hash": fingerprints[path], "chunk_ids": list(chunks)}
+
+        if ids_to_delete:
+            self.vector_store.delete(ids=ids_to_delete)
+        if chunks_to_add:
+            # Chroma upserts by id, re-running after an interrupted ingest is safe
+            self.vector_store.add_documents(
+                chunks_to_add, ids=[chunk.metadata["chunk_id"] for chunk in chunks_to_add]
+            )
+        self.save_manifest(manifest)
+        self.retrieval_cache.clear()
+
+        print(
+            f"Vector store synced: {len(changed)} changed and {len(removed)} removed files, "
+            f"{len(chunks_to_add)} chunks embedded, {len(ids_to_delete)} chunks deleted"
+        )
+
+        self.top_k = top_k
 
-        # Split documents into chunks
+    def split_documents(self, documents, path: str, chunk_size: int = 600):
+        """
+        Split documents into chunks identified by the hash of their file and content
+        """
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
-            chunk_overlap=100,
+            chunk_overlap=CHUNK_OVERLAP,
             separators=["\n\n", "\n", "### ", "## ", "- ", ".", "!", "?", ",", " "],
             length_function=len,
         )
 
         splits = text_splitter.split_documents(documents)
+        for split in splits:
+            split.metadata["chunk_id"] = hashlib.sha256(f"{path}\0{split.page_content}".encode()).hexdigest()
+        return splits
 
-        # Create vector store
-        self.vector_store = Chroma.from_documents(
-            documents=splits, embedding=self.embeddings, persist_directory="./chroma_db"
-        )
-
-        # Set up retriever
-        self.retriever = self.vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": top_k, "score_threshold": 0.1},
-        )
+    def fingerprint_files(self):
+        """
+        Content hash of every markdown file, keyed by its path relative to the data directory
+        """
+        fingerprints = {}
+        for file_path in sorted(glob.glob(os.path.join(self.data_dir, "**/*.md"), recursive=True)):
+            with open(file_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            fingerprints[os.path.relpath(file_path, self.data_dir).replace(os.sep, "/")] = digest
+        return fingerprints
+
+    def load_manifest(self):
+        manifest_path = os.path.join(self.persist_directory, INGEST_MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        manifest_path = os.path.join(self.persist_directory, INGEST_MANIFEST)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
 
     @staticmethod
-    def build_output_format_template(user_id, age_group):
+    def build_output_format_template(age_group):
         """
-        Build the output format template for the story
+        Build the output format template for the story of an age group.
+        user_id is not part of it, the app sets it on the parsed story.
         """
-        print("Building output format template...")
-        print(f"User ID: {user_id}, Age Group: {age_group}")
         return json.dumps(
             {
-                "user_id": user_id,
                 "title": "<judul cerita akan diisi oleh LLM>",
                 "theme": [
                     """
@@ -178,7 +338,7 @@ class FinancialLiteracyRAG:
             indent=4,
         )
 
-    def load_documents(self):
+    def load_documents(self, glob_pattern: str = "**/*.md"):
         """
         Load documents from the data directory
         """
@@ -187,7 +347,7 @@ class FinancialLiteracyRAG:
             return []
 
         # Load documents from directory
-        loader = DirectoryLoader(self.data_dir, glob="**/*.md")
+        loader = DirectoryLoader(self.data_dir, glob=glob_pattern)
         documents = loader.load()
 
         print(f"Loaded {len(documents)} documents from {self.data_dir}")
@@ -195,28 +355,16 @@ class FinancialLiteracyRAG:
 
     def initialize_rag(self, rebuild: bool = False):
         """
-        Initialize the complete RAG system
+        Initialize the complete RAG system, embedding only what changed in the knowledge base
         """
         print("Initializing RAG system...")
         print(f"Data directory: {self.data_dir}")
-        # Check if the persist directory
-        if os.path.exists(self.persist_directory) and not rebuild:
-            self.vector_store = Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=self.embeddings,
-            )
-            self.retriever = self.retriever = self.vector_store.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={"k": 10, "score_threshold": 0.1},
-            )
-            print("Using existing vector store from:", self.persist_directory)
-            return True
-        else:
-            # Setup fresh vector store
-            documents = self.load_documents()
-            self.setup_vector_store(documents)
-            print("RAG system initialized successfully!")
-            return True
+        if rebuild and os.path.exists(self.persist_directory):
+            shutil.rmtree(self.persist_directory)
+
+        self.setup_vector_store()
+        print("RAG system initialized successfully!")
+        return True
 
 
     @staticmethod
@@ -246,143 +394,171 @@ class FinancialLiteracyRAG:
         else:
             return "Gunakan struktur 10 scene default."
 
-    def filter_retrieved_docs(self, docs, age, k=6):
+    @staticmethod
+    def bucket_filters(age):
         """
-        Filter and prioritize documents, prioritizing matching age group and financial concepts before cultural elements and stories.
+        Chroma where filter of each retrieval bucket, "other" searches the whole store
         """
-        # Priority 1: Exact age match
-        age_exact = [
-            doc
-            for doc in docs
-            if doc.metadata.get("min_age", 0) <= age <= doc.metadata.get("max_age", 12)
-            and doc.metadata.get("content_type") == "financial"
-        ]
-
-        # Priority 2: Financial core concepts
-        financial_concepts = [
-            doc
-            for doc in docs
-            if doc.metadata.get("content_type") == "financial"
-            and "core_concepts" in doc.metadata.get("source")
-        ]
-
-        # Priority 3: Cultural elements and stories (universal content)
-        cultural_story = [
-            doc
-            for doc in docs
-            if doc.metadata.get("content_type") in ["cultural", "story"]
-            and doc not in age_exact
-        ]
-
-        # Priority 4: Everything else
-        other_content = [
-            doc
-            for doc in docs
-            if doc not in age_exact
-            and doc not in financial_concepts
-            and doc not in cultural_story
-        ]
-
-        # Combine with limits to ensure balance
-        prioritized_docs = (
-            age_exact[:3]  # Max 3 from exact age
-            + financial_concepts[:2]  # Max 2 from financial core concepts
-            + cultural_story[:2]  # Max 2 cultural/story
-            + other_content  # Fill remaining
-        )[:k]
-
-        print(f"Filtering for age {age}:")
-        print(f"  Age-appropriate: {len(age_exact)}")
-        print(
-            f" Age-appropriate documents: {[doc.metadata.get('source', 'Unknown') for doc in age_exact]}"
+        return {
+            "age_exact": {"$and": [
+                {"content_type": {"$eq": "financial"}},
+                {"min_age": {"$lte": age}},
+                {"max_age": {"$gte": age}},
+            ]},
+            "core_concepts": {"$and": [
+                {"content_type": {"$eq": "financial"}},
+                {"category": {"$eq": "core_concepts"}},
+            ]},
+            "cultural_story": {"content_type": {"$in": ["cultural", "story"]}},
+            "other": None,
+        }
+
+    def search_bucket(self, embedding, where, k, score_threshold=0.1):
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=where
         )
+        return [doc for doc, distance in results if l2_relevance(distance) >= score_threshold]
 
-        print(f"  Adjacent financial: {len(financial_concepts)}")
-        print(
-            f"  Financial concepts documents: {[doc.metadata.get('source', 'Unknown') for doc in financial_concepts]}"
-        )
+    def search_buckets(self, query, age):
+        """
+        One filtered vector search per bucket, all reusing a single query embedding
+        """
+        embedding = self.embeddings.embed_query(query)
+        return {
+            name: self.search_bucket(embedding, where, self.bucket_size(name))
+            for name, where in self.bucket_filters(age).items()
+        }
+
+    async def asearch_buckets(self, query, age):
+        embedding = await self.embeddings.aembed_query(query)
+        filters = self.bucket_filters(age)
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self.search_bucket, embedding, where, self.bucket_size(name))
+            for name, where in filters.items()
+        ))
+        return dict(zip(filters, results))
+
+    def bucket_size(self, name):
+        limit = dict(PRIORITY_BUCKETS)[name]
+        return limit if limit is not None else self.top_k
+
+    def prioritize_docs(self, buckets, age, k=6):
+        """
+        Take documents bucket by bucket within each bucket's limit, skipping ids already taken
+        """
+        selected = []
+        seen = set()
+        for name, limit in PRIORITY_BUCKETS:
+            taken = 0
+            for doc in buckets.get(name, []):
+                if len(selected) == k or (limit is not None and taken == limit):
+                    break
+                doc_id = doc.metadata.get("chunk_id") or doc.page_content
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                selected.append(doc)
+                taken += 1
 
-        print(f"  Cultural/Story: {len(cultural_story)}")
-        print(
-            f"  Cultural/Story documents: {[doc.metadata.get('source', 'Unknown') for doc in cultural_story]}"
-        )
+        print(f"Filtering for age {age}:")
+        for name, _ in PRIORITY_BUCKETS:
+            print(f"  {name}: {[doc.metadata.get('source', 'Unknown') for doc in buckets.get(name, [])]}")
+        print(f"  Final selection: {len(selected)} documents")
+        print(f"  Selected documents: {[doc.metadata.get('source', 'Unknown') for doc in selected]}")
+        return selected
 
-        print(f"  Universal content: {len(other_content)}")
-        print(f"  Other documents: {[doc.metadata.get('source', 'Unknown') for doc in other_content]}")
-        
-        print(f"  Final selection: {len(prioritized_docs)} documents")
-        print(f"  Selected documents: {[doc.metadata.get('source', 'Unknown') for doc in prioritized_docs]}")
-        return prioritized_docs
+    def create_prompt(self, query, age: int):  # Change parameter to int
+        context_docs = self.retrieve_context(query, age)
+        return self.build_prompt(query, age, context_docs)
 
-    def create_prompt(self, query, user_id, age: int):  # Change parameter to int
-        PROMPT_TEMPLATE = """
-        You are an expert Indonesian storyteller specializing in teaching financial literacy to children.
-
-        Generate a JSON-formatted interactive story in **Bahasa Indonesia** for children aged {age}, with:
-        - Indonesian character names and culturally relevant settings (e.g., warung, pasar)
-        - Age-appropriate financial literacy lessons (saving, budgeting, honesty, etc.)
-        - Two decision points (unless otherwise noted), each with two choices, that affect the story ending
-
-        You can use the following context to inform your story, but you are not limited to it. Feel free to create engaging and educational content based on the query provided.
-        ### Context:
-        {context}
-        
-        ### Query:
-        {query}
-
-        ### Story Structure Instructions:
-        {structure_rules}
-
-        ### General Instructions:
-        1. Use simple and engaging Indonesian suitable for age {age}
-        2. Scene types must be: "narrative", "decision_point", or "ending"
-        3. Choices should lead to consequences that are constructive but realistic
-        4. Provide at least two different endings with different moral outcomes
-        5. Do not include markdown or explanations—just clean JSON
-        6. For higher age groups (11 - 12), the decision points can be more like a quiz to test their understanding for the said concept.
-        For example: "Apa itu pegadaian ?"
-
-        ### Format:
-        {output_format}
+    async def acreate_prompt(self, query, age: int):
         """
+        Same as create_prompt, but retrieval (query embedding and vector search) doesn't block the event loop
+        """
+        context_docs = await self.aretrieve_context(query, age)
+        return self.build_prompt(query, age, context_docs)
 
-        # Get relevant context from retriever
-        context_docs = []
-        if self.retriever:
-            try:
-                context_docs = self.retriever.invoke(query)
-                print(f"Retrieved {len(context_docs)} relevant documents")
-
-                # Filter and prioritize documents based on age (now int)
-                prioritized_docs = self.filter_retrieved_docs(context_docs, age)
-
-                # Extract content from documents
-                context = [doc.page_content for doc in prioritized_docs]
-            except Exception as e:
-                print(f"Error retrieving documents: {e}")
-                context = ["Tidak ada konteks yang relevan ditemukan."]
-        else:
+    def retrieve_context(self, query, age: int):
+        """
+        Prioritised context documents for the query, None when retrieval is unavailable
+        """
+        key = self.retrieval_cache_key(query, age)
+        if key in self.retrieval_cache:
+            return self.retrieval_cache[key]
+
+        if not self.vector_store:
             print(
-                "Retriever not initialized. Make sure to call initialize_rag() first."
+                "Vector store not initialized. Make sure to call initialize_rag() first."
             )
-            context = ["Tidak ada konteks yang relevan ditemukan."]
+            return None
+
+        try:
+            buckets = self.search_buckets(query, age)
+        except Exception as e:
+            print(f"Error retrieving documents: {e}")
+            return None
+
+        return self.cache_context(key, buckets, age)
+
+    async def aretrieve_context(self, query, age: int):
+        key = self.retrieval_cache_key(query, age)
+        if key in self.retrieval_cache:
+            return self.retrieval_cache[key]
+
+        if not self.vector_store:
+            print(
+                "Vector store not initialized. Make sure to call initialize_rag() first."
+            )
+            return None
+
+        try:
+            buckets = await self.asearch_buckets(query, age)
+        except Exception as e:
+            print(f"Error retrieving documents: {e}")
+            return None
+
+        return self.cache_context(key, buckets, age)
+
+    def cache_context(self, key, buckets, age: int):
+        print(f"Retrieved {sum(len(docs) for docs in buckets.values())} relevant documents")
+
+        # Prioritize documents based on age (now int)
+        prioritized_docs = self.prioritize_docs(buckets, age)
+        self.retrieval_cache[key] = prioritized_docs
+        return prioritized_docs
+
+    @staticmethod
+    def retrieval_cache_key(query, age: int):
+        # Case, spacing and trailing punctuation don't change what the query is about
+        normalized = re.sub(r"\s+", " ", query).strip().strip(".!?").lower()
+        return normalized, age
+
+    @staticmethod
+    def build_age_section(age: int) -> str:
+        """
+        The per-age part of the prompt: structure rules and output format
+        """
+        return AGE_SECTION.format(
+            age=age,
+            structure_rules=FinancialLiteracyRAG.build_story_structure_rules(age),
+            output_format=FinancialLiteracyRAG.build_output_format_template(age),
+        )
+
+    def build_prompt(self, query, age: int, context_docs):
+        # Extract content from documents
+        context = [doc.page_content for doc in context_docs or []]
 
         if not context:
             context = ["Tidak ada konteks yang relevan ditemukan."]
 
-        output_format = self.build_output_format_template(
-            user_id=user_id, age_group=age  # Keep as int
-        )
-        # Use age directly for structure rules
-        structure_rules = self.build_story_structure_rules(age)
-        # Create and format the prompt
-        prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-        formatted_prompt = prompt.format_prompt(
-            context=context,
+        # Static instructions and the per-age section come first and are identical
+        # across requests, so the provider can reuse the cached prompt prefix
+        return STORY_PROMPT.format_prompt(
+            age_section=AGE_SECTIONS[min(max(age, SUPPORTED_AGES[0]), SUPPORTED_AGES[-1])],
+            context="\n\n".join(context),
             query=query,
-            age=age,
-            output_format=output_format,
-            structure_rules=structure_rules,
         )
 
-        return formatted_prompt
\ No newline at end of file
+
+# Built at import for every supported age, other ages are clamped into the range
+AGE_SECTIONS = {age: FinancialLiteracyRAG.build_age_section(age) for age in SUPPORTED_AGES}
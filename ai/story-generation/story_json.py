@@ -0,0 +1,176 @@
+import json
+from typing import Dict, Tuple
+from story_stream import IncrementalStoryParser
+
+
+class StoryJSONError(ValueError):
+    """Story output that is still invalid JSON after the local repair pass"""
+
+    def __init__(self, text: str, error: json.JSONDecodeError):
+        super().__init__(str(error))
+        self.text = text
+        self.error = error
+
+
+def extract_json(content: str) -> str:
+    """
+    Text from the first "{" on, which skips a leading ```json fence or prose.
+    A trailing fence is ignored by raw_decode / repair_json, fences are not
+    matched with a regex because ``` can appear inside a story string.
+    """
+    start = content.find("{")
+    return content[max(start, 0):].strip()
+
+
+def repair_json(text: str) -> str:
+    """
+    Cheap local fixes for almost-valid JSON from the LLM.
+
+    Escapes raw newlines/tabs inside strings, drops trailing commas before a
+    closing bracket, ignores text after the outermost object and, when the
+    output was cut off, drops a trailing member left without a (complete)
+    value and closes the open strings and brackets. Anything else is left for the fix-up call.
+    """
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char == "\n":
+                char = "\\n"
+            elif char == "\r":
+                char = "\\r"
+            elif char == "\t":
+                char = "\\t"
+            out.append(char)
+            continue
+
+        frame = stack[-1] if stack else None
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append({
+                "close": "}" if char == "{" else "]",
+                "expect_key": char == "{",
+                "member_start": len(out) + 1,
+                "value_start": len(out) + 1,
+            })
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if frame and frame["close"] == char:
+                stack.pop()
+            if not stack:
+                out.append(char)
+                return "".join(out)
+        elif frame and char == ",":
+            frame["expect_key"] = frame["close"] == "}"
+            frame["member_start"] = len(out)
+            frame["value_start"] = len(out) + 1
+        elif frame and char == ":":
+            frame["expect_key"] = False
+            frame["value_start"] = len(out) + 1
+        out.append(char)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    while stack:
+        frame = stack.pop()
+        if _member_incomplete(out, frame):
+            del out[frame["member_start"]:]
+        _drop_trailing_comma(out)
+        out.append(frame["close"])
+
+    return "".join(out)
+
+
+def _member_incomplete(out: list, frame: dict) -> bool:
+    # A key without its colon, a colon without a value, or a cut off literal like "nu"
+    if frame["expect_key"]:
+        return bool("".join(out[frame["member_start"]:]).strip().lstrip(","))
+
+    value = "".join(out[frame["value_start"]:]).strip()
+    if not value:
+        return frame["close"] == "}"
+    if value[0] in '"{[':
+        return False
+    try:
+        json.loads(value)
+        return False
+    except json.JSONDecodeError:
+        return True
+
+
+def _drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def parse_story_json(content: str) -> dict:
+    """Parse the story, trying it as-is first and then after repair_json"""
+    text = extract_json(content)
+    try:
+        story, _ = json.JSONDecoder().raw_decode(text)
+        return story
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        return json.loads(repair_json(text))
+    except json.JSONDecodeError as e:
+        raise StoryJSONError(text, e)
+
+
+def fragment_label(path: tuple) -> str:
+    return path[0] if len(path) == 1 else f"{path[0]}[{path[1]}]"
+
+
+def broken_fragments(text: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Smallest top-level values / scenes of the story that don't parse.
+
+    Returns {label: (start, end)} with labels like "title" or "scene[3]". A
+    broken scene is reported on its own rather than the whole scene array.
+    """
+    parser = IncrementalStoryParser()
+    parser.feed(text)
+
+    broken = {}
+    for path, (start, end) in parser.fragments.items():
+        try:
+            json.loads(repair_json(text[start:end + 1]))
+        except json.JSONDecodeError:
+            broken[path] = (start, end)
+
+    return {
+        fragment_label(path): span
+        for path, span in broken.items()
+        if not any(other[:len(path)] == path and other != path for other in broken)
+    }
+
+
+def complete_scene_count(text: str) -> int:
+    """Scenes whose closing brace is in the text, a cut off story's last scene isn't"""
+    parser = IncrementalStoryParser()
+    parser.feed(text)
+    return sum(1 for path in parser.fragments if len(path) == 2 and path[0] == "scene")
+
+
+def splice_fragments(text: str, spans: Dict[str, Tuple[int, int]], fixed: dict) -> str:
+    """Replace each broken fragment with its fixed value, keeping the rest of the text"""
+    for label, (start, end) in sorted(spans.items(), key=lambda item: item[1][0], reverse=True):
+        if label not in fixed:
+            continue
+        text = text[:start] + json.dumps(fixed[label], ensure_ascii=False) + text[end + 1:]
+    return text
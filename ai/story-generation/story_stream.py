@@ -0,0 +1,150 @@
+import json
+from typing import List, Optional, Tuple
+
+
+class IncrementalStoryParser:
+    """
+    Incremental scanner over the story JSON as the LLM writes it.
+
+    Feed it text chunks; it tracks strings, nesting and object keys, and
+    reports a value as soon as its closing quote/bracket arrives:
+
+    - ("cover", "<description>") when cover_img_description is complete
+    - ("characters", [...]) when the characters array closes
+    - ("scene", {...}) every time an element of the scene array closes
+
+    Anything before the first "{" (for example a ```json fence) is ignored.
+    The full text is kept so the complete story can be parsed at the end,
+    and `fragments` maps the path of every top-level value and scene
+    (("title",), ("scene", 2), ...) to its (start, end) offsets in it,
+    whether or not the value itself is valid JSON.
+    """
+
+    EVENT_PATHS = {
+        ("cover_img_description",): "cover",
+        ("characters",): "characters",
+    }
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._started = False
+        self._done = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self.fragments = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        self.text += chunk
+        events = []
+
+        while self._position < len(self.text) and not self._done:
+            index = self._position
+            char = self.text[index]
+            self._position += 1
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._open("{", index)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string(index, events)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char in "{[":
+                self._open(char, index)
+            elif char in "}]":
+                self._close(index, events)
+            elif char == ":":
+                self._stack[-1]["expect_key"] = False
+            elif char == ",":
+                frame = self._stack[-1]
+                if frame["type"] == "{":
+                    frame["expect_key"] = True
+                else:
+                    frame["index"] += 1
+
+        return events
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def _path(self) -> tuple:
+        return tuple(frame["key"] for frame in self._stack[1:])
+
+    def _child_key(self) -> Optional[object]:
+        if not self._stack:
+            return None
+        frame = self._stack[-1]
+        return frame["current_key"] if frame["type"] == "{" else frame["index"]
+
+    def _open(self, container: str, index: int):
+        self._stack.append({
+            "type": container,
+            "key": self._child_key(),
+            "start": index,
+            "expect_key": container == "{",
+            "current_key": None,
+            "index": 0,
+        })
+
+    def _close(self, index: int, events: list):
+        frame = self._stack[-1]
+        path = self._path()
+        self._stack.pop()
+        if not self._stack:
+            self._done = True
+            return
+        self._emit(path, frame["start"], index, events)
+
+    def _close_string(self, index: int, events: list):
+        frame = self._stack[-1]
+        raw = self.text[self._string_start:index + 1]
+        if frame["type"] == "{" and frame["expect_key"]:
+            frame["current_key"] = _parse_key(raw)
+            return
+        self._emit(self._path() + (self._child_key(),), self._string_start, index, events)
+
+    def _emit(self, path: tuple, start: int, end: int, events: list):
+        if len(path) == 1 or (len(path) == 2 and path[0] == "scene"):
+            self.fragments[path] = (start, end)
+
+        raw = self.text[start:end + 1]
+        event = self.EVENT_PATHS.get(path)
+        if event is None and len(path) == 2 and path[0] == "scene" and raw.startswith("{"):
+            event = "scene"
+        if event is None:
+            return
+
+        try:
+            events.append((event, json.loads(raw)))
+        except json.JSONDecodeError as e:
+            # Malformed fragment, the final parse of the whole story will report it
+            print(f"Skipping malformed {event} fragment: {e}")
+
+
+def _parse_key(raw: str) -> str:
+    # Raw control characters are allowed like repair_json escapes them, a key
+    # that still doesn't parse is kept verbatim so scanning can go on
+    try:
+        return json.loads(raw, strict=False)
+    except json.JSONDecodeError:
+        return raw[1:-1]
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
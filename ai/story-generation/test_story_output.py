@@ -0,0 +1,128 @@
+"""
+Story output repair through the /generate-story endpoints.
+
+The vector store and the LLM are replaced, so this runs without network:
+    pytest test_story_output.py
+"""
+
+import json
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import rag
+
+# Skip the knowledge base ingest app.py runs on import
+rag.FinancialLiteracyRAG.initialize_rag = lambda self, rebuild=False: None
+
+import app
+from fastapi.testclient import TestClient
+from openai import LengthFinishReasonError
+from openai.types.chat import ChatCompletion
+from story_json import parse_story_json
+from story_stream import IncrementalStoryParser
+
+STORY = {
+    "title": "Edo Menabung",
+    "theme": ["Menabung"],
+    "language": "indonesian",
+    "maximum_point": 10,
+    "cover_img_description": "Edo dengan celengan",
+    "characters": [{"name": "Edo", "description": "anak laki-laki"}],
+    "scene": [
+        {"scene_id": 1, "type": "decision_point", "img_description": "Edo", "content": "Edo dapat uang saku.",
+         "branch": [
+             {"choice": "baik", "content": "Menabung", "moral_value": "Hemat", "point": 5, "next_scene": 2},
+             {"choice": "buruk", "content": "Jajan", "moral_value": "Boros", "point": 0, "next_scene": 3},
+         ]},
+        {"scene_id": 2, "type": "ending", "img_description": "Edo", "content": "Edo membeli sepeda.",
+         "lesson_learned": "Menabung itu penting"},
+        {"scene_id": 3, "type": "ending", "img_description": "Edo", "content": "Uang Edo habis.",
+         "lesson_learned": "Jangan boros"},
+    ],
+    "description": "Edo belajar menabung untuk membeli sepeda impiannya.",
+}
+STORY_TEXT = json.dumps(STORY, ensure_ascii=False)
+
+# Cut off at max tokens in the middle of the last ending, which scene 1 links to
+TRUNCATED_IN_SCENE = STORY_TEXT[:STORY_TEXT.index("Uang Edo") + 4]
+# Cut off after the scene array, only the description is incomplete
+TRUNCATED_AFTER_SCENES = STORY_TEXT[:STORY_TEXT.index("untuk")]
+
+async def fake_prompt(query, age):
+    return "prompt"
+
+def length_error(content: str) -> LengthFinishReasonError:
+    return LengthFinishReasonError(completion=ChatCompletion(
+        id="test",
+        object="chat.completion",
+        created=0,
+        model="gpt-4o",
+        choices=[{
+            "index": 0,
+            "finish_reason": "length",
+            "message": {"role": "assistant", "content": content},
+        }],
+    ))
+
+class TruncatedModel:
+    """Behaves like the response_format-bound model when max tokens is hit"""
+
+    def __init__(self, content: str):
+        self.content = content
+
+    async def ainvoke(self, prompt):
+        raise length_error(self.content)
+
+    async def astream(self, prompt):
+        for start in range(0, len(self.content), 50):
+            yield SimpleNamespace(content=self.content[start:start + 50])
+        raise length_error(self.content)
+
+def client(monkeypatch, content: str) -> TestClient:
+    monkeypatch.setattr(app.rag, "acreate_prompt", fake_prompt)
+    monkeypatch.setattr(app, "story_model", TruncatedModel(content))
+    return TestClient(app.app)
+
+def generate(monkeypatch, content: str, path: str = "/generate-story"):
+    return client(monkeypatch, content).post(path, json={"query": "menabung", "user_id": "u1", "age": 7})
+
+def stream_events(response) -> list:
+    return [line[len("event: "):] for line in response.text.splitlines() if line.startswith("event: ")]
+
+def test_generate_story_keeps_story_cut_off_after_the_scenes(monkeypatch):
+    response = generate(monkeypatch, TRUNCATED_AFTER_SCENES)
+
+    assert response.status_code == 200
+    story = response.json()
+    assert story["title"] == STORY["title"]
+    assert story["user_id"] == "u1"
+    assert [scene["scene_id"] for scene in story["scene"]] == [1, 2, 3]
+
+def test_generate_story_rejects_story_cut_off_in_a_scene(monkeypatch):
+    # The unfinished scene 3 is dropped, scene 1 would then lead to a dead end
+    response = generate(monkeypatch, TRUNCATED_IN_SCENE)
+
+    assert response.status_code == 500
+    assert "1 -> 3" in response.json()["detail"]
+
+def test_generate_story_stream_keeps_story_cut_off_after_the_scenes(monkeypatch):
+    events = stream_events(generate(monkeypatch, TRUNCATED_AFTER_SCENES, "/generate-story/stream"))
+
+    assert events.count("scene") == 3
+    assert events[-1] == "complete"
+
+def test_generate_story_stream_rejects_story_cut_off_in_a_scene(monkeypatch):
+    events = stream_events(generate(monkeypatch, TRUNCATED_IN_SCENE, "/generate-story/stream"))
+
+    assert events[-1] == "error"
+
+def test_fence_inside_a_string_is_kept():
+    content = '```json\n{"a": "use ``` here", "b": 1}\n```'
+    assert parse_story_json(content) == {"a": "use ``` here", "b": 1}
+
+def test_key_with_control_character_does_not_stop_scanning():
+    parser = IncrementalStoryParser()
+    parser.feed('{"title": "x", "sce\nne": [{"scene_id": 1}], "description": "d"}')
+    assert ("description",) in parser.fragments
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON serialisation of backend responses.
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json via JSONResponse)
+with ORJSONResponse for a full book shaped like handler/scene_sample.json and
+for a 100 book library page.
+
+Run from the backend directory:
+    python -m benchmark.json_serialization
+"""
+
+import json
+import timeit
+from datetime import datetime
+from beanie import PydanticObjectId
+from pydantic import TypeAdapter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from models.book import Book
+from schema.response.book_card import Book_Card
+from utils.response import ORJSONResponse
+
+ITERATIONS = 200
+
+def build_book() -> Book:
+    with open("./handler/scene_sample.json", "r", encoding="utf-8") as f:
+        book = json.load(f)
+    book.update({
+        "id": PydanticObjectId(),
+        "description": "A story about financial literacy for children.",
+        "estimated_reading_time": 600
+    })
+    # Validate field by field, a Document instance can't be built before init_beanie
+    fields = {
+        name: TypeAdapter(field.annotation).validate_python(book[name])
+        for name, field in Book.model_fields.items()
+        if name in book
+    }
+    return Book.model_construct(**fields)
+
+def build_library_page(size: int = 100) -> list:
+    return [
+        Book_Card(
+            id= str(PydanticObjectId()),
+            title= f"Cerita {index}",
+            language= "indonesian",
+            description= "A story about financial literacy for children.",
+            estimation_time_to_read= "10 minutes",
+            cover_img_url= f"https://bihackathon.blob.core.windows.net/storage/images/{index}.png",
+            created_at= str(datetime.utcnow())
+        )
+        for index in range(size)
+    ]
+
+def default_response(content):
+    return JSONResponse(jsonable_encoder(content)).body
+
+def orjson_response(content):
+    return ORJSONResponse(content).body
+
+def run(name: str, content):
+    assert json.loads(default_response(content)) == json.loads(orjson_response(content)), f"{name}: payloads differ"
+
+    default_time = timeit.timeit(lambda: default_response(content), number=ITERATIONS) / ITERATIONS
+    orjson_time = timeit.timeit(lambda: orjson_response(content), number=ITERATIONS) / ITERATIONS
+
+    print(f"{name}:")
+    print(f"  payload size              : {len(orjson_response(content))} bytes")
+    print(f"  jsonable_encoder + json   : {default_time * 1000:.3f} ms")
+    print(f"  ORJSONResponse            : {orjson_time * 1000:.3f} ms")
+    print(f"  speedup                   : {default_time / orjson_time:.1f}x")
+
+if __name__ == "__main__":
+    run("Book (scene_sample.json)", {"data": build_book()})
+    run("Library page (100 books)", {"data": build_library_page(), "next_cursor": None})
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark event loop responsiveness during a burst of logins.
+
+Runs CONCURRENT_LOGINS password verifications at once, first calling
+PasswordHasher.verify on the event loop (the old login path) and then through
+utils.hash.compare (thread pool). A heartbeat task ticking every
+HEARTBEAT_INTERVAL measures how late the loop wakes it, which is the delay
+every other request on the worker would see.
+
+Run from the backend directory:
+    python -m benchmark.login_storm
+"""
+
+import asyncio
+import time
+from utils import hash as password_hash
+
+CONCURRENT_LOGINS = 50
+HEARTBEAT_INTERVAL = 0.005
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(time.perf_counter() - start - HEARTBEAT_INTERVAL)
+
+async def blocking_login(hashed: str) -> bool:
+    return password_hash._verify("password123", hashed)
+
+async def pooled_login(hashed: str) -> bool:
+    return await password_hash.compare("password123", hashed)
+
+async def run(name: str, login, hashed: str):
+    stop = asyncio.Event()
+    lags = []
+    monitor = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(hashed) for _ in range(CONCURRENT_LOGINS)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    assert all(results), f"{name}: verification failed"
+
+    lags.sort()
+    print(f"{name}:")
+    print(f"  total time               : {elapsed * 1000:.0f} ms")
+    print(f"  heartbeat ticks          : {len(lags)}")
+    print(f"  median loop lag          : {lags[len(lags) // 2] * 1000:.1f} ms")
+    print(f"  max loop lag             : {lags[-1] * 1000:.1f} ms")
+
+async def main():
+    hashed = await password_hash.hash("password123")
+    await run("verify on the event loop", blocking_login, hashed)
+    await run("utils.hash.compare (thread pool)", pooled_login, hashed)
+
+if __name__ == "__main__":
+    asyncio.run(main())
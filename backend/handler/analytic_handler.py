@@ -1,14 +1,25 @@
 from fastapi import HTTPException, Query, Request
 from collections import defaultdict
-from models.book import Book
+from models.book import Book, LatestBookView, ActiveStoryView
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import asyncio
 from utils.api_request import stream
+from utils.cache import analytic_cache
 from setting.settings import settings
+from schema.request import analytic_schema
 
 async def get_analytic(current_user):
     user_id = current_user.get("id")
-    books = await Book.find(Book.user_id == user_id).to_list()
+    cache_key = analytic_cache.key(user_id, "dashboard")
+    cached = analytic_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    books, recent_activity = await asyncio.gather(
+        Book.find(Book.user_id == user_id).to_list(),
+        _get_recent_activity(user_id)
+    )
 
     if not books:
         raise HTTPException(status_code= 404, detail= f"user doesn't have book, please create one")
@@ -21,28 +32,90 @@ async def get_analytic(current_user):
     weekly_timeline = child_analytic.get("weekly_timeline")
     overall_stats = child_analytic.get("overall_stats")
     
-    return {
+    latest_book = recent_activity.get("latest_book")
+    active_story = recent_activity.get("active_story")
+
+    result = {
         "data": {
             "child_info": {
                 "user_id": user_id,
-                "age_group": "8-10",
-                "last_active": "2025-01-15T14:20:00Z"
+                "age_group": _age_group_range(latest_book.age_group) if latest_book else None,
+                "last_active": _last_active(latest_book)
             },
             "recent_status": {
-                "active_story": {
-                    "title": "Celengan Si Kecil",
-                    "current_scene": 3,
-                    "total_scenes": 8,
-                    "started_at": "2025-01-15T14:00:00Z"
-                },
-                "today_minutes": 25,
-                "this_week_minutes": 120
+                "active_story": active_story.dict() if active_story else None,
+                "today_minutes": recent_activity.get("today_minutes"),
+                "this_week_minutes": recent_activity.get("this_week_minutes")
             },
             "concept_performance": concept_performance,
             "weekly_timeline": weekly_timeline,
             "overall_stats": overall_stats
         }
     }
+    analytic_cache.set(cache_key, result)
+
+    return result
+
+async def _get_recent_activity(user_id: str) -> dict:
+    """
+    Recent activity from small index-backed queries on (user_id, status, created_at),
+    independent of how many books the user has.
+    """
+    # created_at is stored as naive UTC
+    now = datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today_start - timedelta(days=today_start.weekday())
+
+    latest_book, active_story, minutes = await asyncio.gather(
+        Book.find(Book.user_id == user_id)
+            .sort(-Book.created_at)
+            .project(LatestBookView)
+            .first_or_none(),
+        Book.find(Book.user_id == user_id, Book.status == "in_progress")
+            .sort(-Book.created_at)
+            .project(ActiveStoryView)
+            .first_or_none(),
+        Book.find(Book.user_id == user_id, Book.created_at >= week_start)
+            .aggregate([
+                {
+                    "$group": {
+                        "_id": None,
+                        "this_week_seconds": {"$sum": "$user_story.finished_time"},
+                        "today_seconds": {
+                            "$sum": {
+                                "$cond": [
+                                    {"$gte": ["$created_at", today_start]},
+                                    "$user_story.finished_time",
+                                    0
+                                ]
+                            }
+                        }
+                    }
+                }
+            ])
+            .to_list()
+    )
+
+    minutes = minutes[0] if minutes else {}
+    return {
+        "latest_book": latest_book,
+        "active_story": active_story,
+        "today_minutes": round((minutes.get("today_seconds") or 0) / 60, 1),
+        "this_week_minutes": round((minutes.get("this_week_seconds") or 0) / 60, 1)
+    }
+
+def _last_active(latest_book: Optional[LatestBookView]) -> Optional[datetime]:
+    if not latest_book:
+        return None
+    activity = [date for date in [latest_book.created_at, latest_book.finished_at] if date]
+    return max(activity) if activity else None
+
+def _age_group_range(age: int) -> str:
+    if age <= 7:
+        return "4-7"
+    elif age <= 10:
+        return "8-10"
+    return "11-12"
 
 def _aggregate_child_analytic(books: list) -> dict:
     concept_performance = defaultdict(lambda: {
@@ -132,14 +205,13 @@ def _aggregate_child_analytic(books: list) -> dict:
         data["success_rate"] = round((correct / total) * 100, 1) if total > 0 else 0.0
     
     final_weekly_timeline = []
+    overall_session_durations = []
     for week_start, data in weekly_timeline.items():
+        overall_session_durations.extend(data["session_durations"])
         total_choices = data["total_choices"]
         success_rate = round((data["successes"] / total_choices) * 100, 1) if total_choices > 0 else 0.0
         
-        avg_session = (
-            sum(data["session_durations"]) / len(data["session_durations"])
-            if data["session_durations"] else 0.0
-        )
+        session_durations = data["session_durations"]
         
         final_weekly_timeline.append({
             "week": week_start,
@@ -149,7 +221,9 @@ def _aggregate_child_analytic(books: list) -> dict:
                 "success_rate": success_rate,
                 "concepts_encountered": list(data["concepts_encountered"]),
                 "active_days": len(data["active_days"]),
-                "average_session_duration": round(avg_session, 1)
+                "average_session_duration": _round_mean(session_durations),
+                "median_session_duration": _round_quantile(session_durations, 0.5),
+                "p90_session_duration": _round_quantile(session_durations, 0.9)
             }
         })
     
@@ -183,96 +257,93 @@ def _aggregate_child_analytic(books: list) -> dict:
             "concepts_mastered": concepts_mastered,
             "concepts_learning": concepts_learning,
             "concepts_struggling": concepts_struggling,
-            "account_created": overall_stats["account_created"]
+            "account_created": overall_stats["account_created"],
+            "average_session_duration": _round_mean(overall_session_durations),
+            "median_session_duration": _round_quantile(overall_session_durations, 0.5),
+            "p90_session_duration": _round_quantile(overall_session_durations, 0.9)
         }
     }
 
-def _filter_books_by_time(
-        books: list,
+def _round_mean(values: list) -> float:
+    return round(sum(values) / len(values), 1) if values else 0.0
+
+def _round_quantile(values: list, q: float) -> float:
+    """Exact quantile with linear interpolation, the durations are already in memory"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = q * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower), 1)
+
+def _resolve_time_window(
         time_unit: Optional[str] = None,
         num_periods: Optional[int] = None,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None
-) -> list:
-    """Filter books based on time parameters"""
-    if not any([time_unit, num_periods, start_date, end_date]):
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Resolve time parameters once into a (start, end) created_at window, None means unbounded"""
+    if start_date or end_date:
+        return _parse_date(start_date), _parse_date(end_date)
+
+    if num_periods and time_unit:
+        if time_unit == "week":
+            delta = timedelta(weeks=num_periods)
+        elif time_unit == "month":
+            delta = timedelta(days=30 * num_periods)  # Approximate
+        elif time_unit == "day":
+            delta = timedelta(days=num_periods)
+        else:
+            return None, None
+        return datetime.now(timezone.utc) - delta, None
+
+    return None, None
+
+def _parse_date(date: Optional[str]) -> Optional[datetime]:
+    if not date:
+        return None
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"invalid date {date}, expected YYYY-MM-DD")
+
+def _merge_time_windows(windows: list) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Smallest window covering every given window"""
+    starts = [start for start, _ in windows]
+    ends = [end for _, end in windows]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+    return start, end
+
+def _filter_books_by_time(books: list, window: Tuple[Optional[datetime], Optional[datetime]]) -> list:
+    """Filter already loaded books by a resolved created_at window"""
+    start, end = window
+    if not start and not end:
         return books
 
-    now = datetime.now(timezone.utc)
     filtered_books = []
-
     for book in books:
         created_at = book.get("created_at")
         if not created_at:
             continue
-            
-        # FIX: Ensure created_at is offset-aware before comparison
+
+        # Ensure created_at is offset-aware before comparison
         if created_at.tzinfo is None:
             created_at = created_at.replace(tzinfo=timezone.utc)
 
-        # Handle different time filter cases
-        if start_date and end_date:
-            start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            if start <= created_at <= end:
-                filtered_books.append(book)
-
-        elif start_date and not end_date:
-            start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            if start <= created_at <= now:
-                filtered_books.append(book)
-
-        elif num_periods and time_unit:
-            if time_unit == "week":
-                delta = timedelta(weeks=num_periods)
-            elif time_unit == "month":
-                delta = timedelta(days=30 * num_periods)  # Approximate
-            else:
-                delta = timedelta(days=0)
-            
-            start = now - delta
-            if created_at >= start:
-                filtered_books.append(book)
-                
+        if (not start or created_at >= start) and (not end or created_at <= end):
+            filtered_books.append(book)
+
     return filtered_books
 
 # New helper funtion for perfromance timeline and aggregation
-def _aggregate_timeline(
-    books: list,
-    time_unit: str = 'week',
-    num_periods: Optional[int] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None
-):
+def _aggregate_timeline(books: list, time_unit: Optional[str] = 'week'):
     """
-        Filter books based on time parameters for performance timeline, aggregating per week or month.
+        Aggregate books per week or month for performance timeline, books are expected to be already filtered by time.
     """
-    if not any([time_unit, start_date, end_date]):
-        return books
-    
-    
-    def _to_utc_aware(dt):
-        return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
-    
-    # Filter books by start and end date if provided
-    if start_date or end_date:
-        start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) if start_date else None
-        end = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) if end_date else None
-        
-        books = [
-            book for book in books
-            if (not start or _to_utc_aware(book.get("created_at", datetime.min)) >= start)
-            and (not end or _to_utc_aware(book.get("created_at", datetime.max)) <= end)
-        ]
-    elif num_periods:
-        now = datetime.now(timezone.utc)
-        start = now - timedelta(weeks=num_periods) if time_unit == 'week' else now - timedelta(days=30 * num_periods)
-        books = [
-            book for book in books
-            if _to_utc_aware(book.get("created_at", datetime.min)) >= start
-        ]
+    time_unit = time_unit or 'week'
 
-    
     # Then aggregate per time unit from start to end
     timeline = defaultdict(lambda: {
         "total_minutes_played": 0,
@@ -331,10 +402,7 @@ def _aggregate_timeline(
         total_choices = data["total_choices"]
         success_rate = round((data["successes"] / total_choices) * 100, 1) if total_choices > 0 else 0.0
         
-        avg_session = (
-            sum(data["session_durations"]) / len(data["session_durations"])
-            if data["session_durations"] else 0.0
-        )
+        session_durations = data["session_durations"]
         
         final_timeline.append({
             "time_unit": time_key,
@@ -344,7 +412,9 @@ def _aggregate_timeline(
                 "success_rate": success_rate,
                 "concepts_encountered": list(data["concepts_encountered"]),
                 "active_days": len(data["active_days"]),
-                "average_session_duration": round(avg_session, 1)
+                "average_session_duration": _round_mean(session_durations),
+                "median_session_duration": _round_quantile(session_durations, 0.5),
+                "p90_session_duration": _round_quantile(session_durations, 0.9)
             }
         })
         final_timeline.sort(key=lambda x: x["time_unit"], reverse=True)
@@ -402,27 +472,14 @@ async def get_concept_performance(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
-    user_id = current_user.get("id")
-    books = await Book.find(Book.user_id == user_id).to_list()
-    
-    if not books:
-        raise HTTPException(status_code=404, detail="User doesn't have any books")
-    
-    # Convert to list of dictionaries
-    books_dict = [book.dict() for book in books]
-    
-    # Apply time filtering
-    filtered_books = _filter_books_by_time(
-        books_dict, time_unit, num_periods, start_date, end_date
-    )
-    
-    # Parse theme filter if provided
-    theme_list = themes
-    
-    # Aggregate concept performance
-    concept_performance = _aggregate_concept_performance(filtered_books, theme_list)
-    
-    return {"concept_performance": concept_performance}
+    params = {
+        "themes": _parse_themes(themes),
+        "time_unit": time_unit,
+        "num_periods": num_periods,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    return await _get_metric(current_user, "concept-performance", params)
 
 # Performance timeline endpoint handler
 async def get_performance_timeline(
@@ -432,32 +489,146 @@ async def get_performance_timeline(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
-    user_id = current_user.get("id")
-    books = await Book.find(Book.user_id == user_id).to_list()
-    
-    if not books:
-        raise HTTPException(status_code=404, detail="User doesn't have any books")
-    
-    # Convert to list of dictionaries
-    books_dict = [book.dict() for book in books]
-    
-    # Aggregate performance timeline
-    timeline = _aggregate_timeline(books_dict, time_unit, num_periods, start_date, end_date)
-    
-    return {"performance_timeline": timeline}
+    params = {
+        "time_unit": time_unit,
+        "num_periods": num_periods,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    return await _get_metric(current_user, "performance-timeline", params)
 
 # Overall statistics endpoint handler
 async def get_overall_statistic(current_user):
-    user_id = current_user.get("id")    
-    books = await Book.find(Book.user_id == user_id).to_list()
-    
-    if not books:
+    return await _get_metric(current_user, "overall-statistics", {})
+
+# Batched metrics endpoint handler, answers every spec from one book scan
+async def get_analytic_batch(current_user, body: analytic_schema.analytic_batch_schema):
+    user_id = current_user.get("id")
+
+    results = [None] * len(body.metrics)
+    missing = []
+    for index, spec in enumerate(body.metrics):
+        api_type = spec.api_type.value
+        params = _metric_params(api_type, spec)
+        cache_key = analytic_cache.key(user_id, api_type, params)
+        cached = analytic_cache.get(cache_key)
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.append((index, api_type, params, cache_key))
+
+    if missing:
+        # One query over the window covering every missing spec, then narrow per spec in memory
+        windows = [_metric_window(params) for _, _, params, _ in missing]
+        books_dict = await _load_books_dict(user_id, _merge_time_windows(windows))
+        for (index, api_type, params, cache_key), window in zip(missing, windows):
+            result = _METRIC_AGGREGATORS[api_type](_filter_books_by_time(books_dict, window), **params)
+            analytic_cache.set(cache_key, result)
+            results[index] = result
+
+    return {
+        "data": [
+            {
+                "api_type": spec.api_type.value,
+                "result": result
+            }
+            for spec, result in zip(body.metrics, results)
+        ]
+    }
+
+async def _get_metric(current_user, api_type: str, params: dict):
+    user_id = current_user.get("id")
+    cache_key = analytic_cache.key(user_id, api_type, params)
+    cached = analytic_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Only books inside the window are read from Mongo
+    books_dict = await _load_books_dict(user_id, _metric_window(params))
+    result = _METRIC_AGGREGATORS[api_type](books_dict, **params)
+    analytic_cache.set(cache_key, result)
+
+    return result
+
+async def _load_books_dict(
+        user_id: str,
+        window: Tuple[Optional[datetime], Optional[datetime]] = (None, None)
+) -> list:
+    """Load user's books, range filtered on the (user_id, created_at) index"""
+    start, end = window
+    conditions = [Book.user_id == user_id]
+    if start:
+        conditions.append(Book.created_at >= start)
+    if end:
+        conditions.append(Book.created_at <= end)
+
+    books = await Book.find(*conditions).to_list()
+
+    # An empty window is a valid answer, only a user without any book is not
+    if not books and (len(conditions) == 1 or not await Book.find(Book.user_id == user_id).count()):
         raise HTTPException(status_code=404, detail="User doesn't have any books")
-    
-    books_dict = [book.dict() for book in books]
-    
-    child_analytic = _aggregate_child_analytic(books_dict)
-    return child_analytic["overall_stats"]
+
+    # Convert to list of dictionaries
+    return [book.dict() for book in books]
+
+def _concept_performance_result(
+    books: list,
+    themes: Optional[List[str]] = None,
+    time_unit: Optional[str] = None,
+    num_periods: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    return {"concept_performance": _aggregate_concept_performance(books, themes)}
+
+def _performance_timeline_result(
+    books: list,
+    time_unit: Optional[str] = None,
+    num_periods: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    return {"performance_timeline": _aggregate_timeline(books, time_unit)}
+
+def _overall_statistic_result(books: list) -> dict:
+    return _aggregate_child_analytic(books)["overall_stats"]
+
+def _metric_window(params: dict) -> Tuple[Optional[datetime], Optional[datetime]]:
+    return _resolve_time_window(
+        params.get("time_unit"),
+        params.get("num_periods"),
+        params.get("start_date"),
+        params.get("end_date")
+    )
+
+_METRIC_AGGREGATORS = {
+    "concept-performance": _concept_performance_result,
+    "performance-timeline": _performance_timeline_result,
+    "overall-statistics": _overall_statistic_result
+}
+
+def _metric_params(api_type: str, spec: analytic_schema.metric_spec_schema) -> dict:
+    """Build the same params (and so the same cache key) the single endpoints use"""
+    if api_type == "overall-statistics":
+        return {}
+
+    params = {
+        "time_unit": spec.time_unit,
+        "num_periods": spec.num_periods,
+        "start_date": spec.start_date,
+        "end_date": spec.end_date
+    }
+    if api_type == "concept-performance":
+        params["themes"] = _parse_themes(spec.themes)
+    return params
+
+def _parse_themes(themes) -> Optional[List[str]]:
+    if not themes:
+        return None
+    if isinstance(themes, str):
+        themes = themes.split(",")
+    parsed = [theme.strip() for theme in themes if theme.strip()]
+    return parsed or None
 
 ai_url = settings.CHILD_MONITORING_URL
 async def chat_stream(
@@ -1,12 +1,11 @@
 from fastapi import HTTPException
 from schema.request.auth_schema import login_schema,register_schema,google_login_schema
 from models.user import User, AuthProvider
-from utils.hash import hash,compare
+from utils.hash import hash,compare,needs_rehash
 from datetime import datetime
 from utils.jwt import create_access_token
-from google.auth.transport import requests
-from google.oauth2 import id_token
-from setting.settings import settings
+from utils.cache import user_profile_cache
+from utils.google_auth import verify_google_id_token
 
 async def register(body: register_schema):
     user = await User.find_one(User.email == body.email)
@@ -16,7 +15,7 @@ async def register(body: register_schema):
     user = User(
         name = body.name,
         email = body.email,
-        password = hash(body.password),
+        password = await hash(body.password),
         auth = AuthProvider.local,
         google_id = None
     )
@@ -36,11 +35,15 @@ async def login(body: login_schema):
     if user.auth == AuthProvider.google:
         raise HTTPException(status_code= 404, detail= f"User with email {body.email} not found")
 
-    isMatch = compare(body.password, user.password)
+    isMatch = await compare(body.password, user.password)
 
     if not isMatch:
         raise HTTPException(status_code= 401, detail= "Password in correct")
 
+    # Upgrade the stored hash once the Argon2 parameters in settings change
+    if needs_rehash(user.password):
+        await user.set({User.password: await hash(body.password)})
+
     token = create_access_token(user)
 
     return {
@@ -48,14 +51,11 @@ async def login(body: login_schema):
     }
 
 async def google_login(body: google_login_schema):
-    id_info = id_token.verify_oauth2_token(
-        body.id_token,
-        requests.Request(),
-        settings.GOOGLE_CLIENT_ID
-    )
+    # Verified locally against the cached Google signing keys, issuer and audience included
+    id_info = await verify_google_id_token(body.id_token)
 
-    if id_info['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-        raise ValueError('Wrong issuer.')
+    if id_info is None:
+        raise HTTPException(status_code= 401, detail= "Invalid Google id token")
 
     google_user_id = id_info['sub']
     email = id_info['email']
@@ -68,6 +68,7 @@ async def google_login(body: google_login_schema):
         user.google_id = google_user_id
         user.updated_at = datetime.utcnow()
         await user.save()
+        user_profile_cache.pop(str(user.id), None)
     else:
         user = User(
             name=name,
@@ -1,18 +1,23 @@
-from utils.ai.concurrent import generate_multiple_image_and_voice_concurrently
-from utils.api_request import post
+from utils.ai.concurrent import generate_image_or_voice
+from utils.api_request import stream_events
 from fastapi import HTTPException
+from beanie import PydanticObjectId
+from beanie.operators import And, Exists, Or
 from setting.settings import settings
 from schema.request import book_schema
 from schema.response.book_card import Book_Card
 from collections import defaultdict
-from models.book import Book
+from models.book import Book, BookCardView, BookSceneView, BookVersionView
 from utils.ai.text_to_speech import AVAILABLE_VOICES
+from utils.cache import analytic_cache
+from utils import http_cache, book_bundle
+from utils.response import ORJSONResponse
+from datetime import datetime
+from typing import Optional
+import asyncio
+import base64
 import json
 
-dummy_scene_json = None
-with open("./handler/scene_sample.json", "r", encoding="utf-8") as f:
-    dummy_scene_json = json.load(f)
-
 book_stort_generation_url = settings.BOOK_STORY_GENERATION_URL
 
 async def create_book(body: book_schema.create_book_schema, current_user):
@@ -23,61 +28,16 @@ async def create_book(body: book_schema.create_book_schema, current_user):
     if not voice_name_code in AVAILABLE_VOICES.keys():
         raise HTTPException(status_code= 400, detail= f"invalid language_code")
 
-    # fetch to book_stort_generation_url
-    book = await post(
-        url= f"{book_stort_generation_url}/generate-story",
+    # Media generation for a scene starts as soon as the story service streams it
+    book, result = await _generate_story_and_media(
         body= {
             "query": query,
             "user_id": current_user.get("id"),
             "age": age
-        }
+        },
+        voice_name_code= voice_name_code
     )
 
-    # book = dummy_scene_json
-
-    scenes = book.get("scene")
-    extracted_scenes = [
-        {
-            "scene_id": scene.get("scene_id"),
-            "img_description": scene.get("img_description"),
-            "content": scene.get("content")
-        }
-        for scene in scenes
-    ]
-
-    cover_img_description = book.get("cover_img_description")
-    characters = book.get("characters")
-
-    requests = []
-    requests.append({
-        "scene_id": None,
-        "type": "cover_image",
-        "prompt": _add_character_description(
-            characters=characters,
-            img_description=cover_img_description
-        )
-    })
-
-    for extracted_scene in extracted_scenes:
-        img_description = extracted_scene.get("img_description")
-
-        requests.append({
-            "scene_id": extracted_scene.get("scene_id"),
-            "type": "image",
-            "prompt": _add_character_description(
-                characters=characters,
-                img_description=img_description
-            )
-        })
-        requests.append({
-            "scene_id": extracted_scene.get("scene_id"),
-            "type": "voice",
-            "voice_name_code": voice_name_code,
-            "prompt": extracted_scene.get("content")
-        })
-
-    result = await generate_multiple_image_and_voice_concurrently(requests)
-
     scene_data = defaultdict(list)
     for item in result:
         scene_data[item["scene_id"]].append(item)
@@ -105,6 +65,7 @@ async def create_book(body: book_schema.create_book_schema, current_user):
         cover_img_url= book.get("cover_img_url"),
         description= book.get("description"),
         estimated_reading_time= book.get("estimated_reading_time"),
+        estimation_time_to_read= _time_estimation_format(book.get("estimated_reading_time")),
         theme= book.get("theme",None) or book.get("tema",None),
         age_group= book.get("age_group"),
         language= book.get("language"),
@@ -120,6 +81,7 @@ async def create_book(body: book_schema.create_book_schema, current_user):
     )
 
     await new_book.insert()
+    analytic_cache.invalidate(new_book.user_id)
 
     return {
         "message": "successfully create new book",
@@ -128,25 +90,332 @@ async def create_book(body: book_schema.create_book_schema, current_user):
         }
     }
 
-async def get_books(current_user):
-    books = await Book.find(Book.user_id == current_user.get("id")).to_list()
+async def get_books(
+    current_user,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = None
+):
+    conditions = [Book.user_id == current_user.get("id")]
+    if cursor:
+        created_at, book_id = _decode_cursor(cursor)
+        conditions.append(Or(
+            Book.created_at < created_at,
+            And(Book.created_at == created_at, Book.id < book_id)
+        ))
+
+    # Only card fields are read, newest first over the (user_id, created_at) index
+    books = await (
+        Book.find(*conditions)
+            .sort(-Book.created_at, -Book.id)
+            .limit(limit + 1)
+            .project(BookCardView)
+            .to_list()
+    )
+
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        next_cursor = _encode_cursor(books[-1])
+
+    response = ORJSONResponse({
+        "data": _format_book_cards(books),
+        "next_cursor": next_cursor
+    })
+
+    etag = http_cache.content_etag(response.body)
+    if http_cache.etag_matches(if_none_match, etag):
+        return http_cache.not_modified(etag, http_cache.LIBRARY_CACHE_CONTROL)
+    response.headers.update(http_cache.cache_headers(etag, http_cache.LIBRARY_CACHE_CONTROL))
+
+    return response
+
+async def get_book_by_id(id: str, current_user, if_none_match: Optional[str] = None):
+    user_id = current_user.get("id")
+
+    # Revalidation only reads the version, the full document is loaded when it changed
+    if if_none_match:
+        book_version = await Book.find_one(Book.id == _to_object_id(id)).project(BookVersionView)
+        _check_book_owner(id, book_version, user_id)
+
+        etag = http_cache.version_etag(id, book_version.version)
+        if http_cache.etag_matches(if_none_match, etag):
+            return http_cache.not_modified(etag, http_cache.BOOK_CACHE_CONTROL)
+
+    book = await Book.get(_to_object_id(id))
+    _check_book_owner(id, book, user_id)
+
+    # The Book is dumped by pydantic-core directly, no jsonable_encoder pass
+    return ORJSONResponse(
+        {
+            "data": book
+        },
+        headers=http_cache.cache_headers(http_cache.version_etag(id, book.version), http_cache.BOOK_CACHE_CONTROL)
+    )
+
+async def get_book_scene(id: str, scene_id: int, current_user):
+    # One round trip returning the scene plus media of the scenes it can lead to
+    pipeline = [
+        {"$match": {"_id": _to_object_id(id)}},
+        {"$project": {
+            "user_id": 1,
+            "scenes": "$scene",
+            "scene": {
+                "$arrayElemAt": [
+                    {"$filter": {
+                        "input": "$scene",
+                        "as": "scene",
+                        "cond": {"$eq": ["$$scene.scene_id", scene_id]}
+                    }},
+                    0
+                ]
+            }
+        }},
+        {"$project": {
+            "user_id": 1,
+            "scene": 1,
+            "next_scenes": {
+                "$map": {
+                    "input": {"$filter": {
+                        "input": "$scenes",
+                        "as": "next",
+                        "cond": {"$in": [
+                            "$$next.scene_id",
+                            {"$concatArrays": [
+                                ["$scene.next_scene"],
+                                {"$ifNull": ["$scene.branch.next_scene", []]}
+                            ]}
+                        ]}
+                    }},
+                    "as": "next",
+                    "in": {
+                        "scene_id": "$$next.scene_id",
+                        "img_url": "$$next.img_url",
+                        "voice_url": "$$next.voice_url"
+                    }
+                }
+            }
+        }}
+    ]
+    result = await Book.aggregate(pipeline).to_list()
+    book = BookVersionView(**result[0]) if result else None
+
+    user_id = current_user.get("id")
+    _check_book_owner(id, book, user_id)
+
+    scene = result[0].get("scene")
+    if not scene:
+        raise HTTPException(status_code= 404, detail= f"scene {scene_id} not found in book with id {id}")
+
     return {
-        "data": _format_book_cards(books)
+        "data": {
+            "book_id": id,
+            "scene": scene,
+            "next_scenes": result[0].get("next_scenes", [])
+        }
     }
 
-async def get_book_by_id(id: str, current_user):
-    book = await Book.get(id)
+async def get_book_bundle(id: str, current_user):
+    book = await Book.get(_to_object_id(id))
+    _check_book_owner(id, book, current_user.get("id"))
+
+    # FileResponse answers Range / If-Range itself, interrupted downloads resume.
+    # The bundle stays pinned (not evicted) until the response is done
+    path = await book_bundle.get_bundle_path(book)
+    return book_bundle.BundleResponse(
+        path,
+        media_type= "application/zip",
+        filename= f"book-{id}.zip",
+        headers= {"Cache-Control": http_cache.BOOK_CACHE_CONTROL}
+    )
+
+async def update_book_progress(id: str, body: book_schema.update_progress_schema, current_user):
+    user_id = current_user.get("id")
+
+    # Targeted operators on the progress fields only, never a whole document rewrite
+    update = {
+        "$push": {"user_story.visited_scene": body.scene_id},
+        "$set": {"current_scene": body.scene_id},
+        "$inc": {"version": 1}
+    }
+    array_filters = None
+
+    if body.choice:
+        # Choice label and point come from the book's own branch, never from the client
+        branch = await _find_branch(id, body.choice, user_id)
+        update["$push"]["user_story.choices"] = {
+            "scene_id": body.choice.scene_id,
+            "choice": branch["choice"],
+            "point": branch.get("point", 0)
+        }
+        update["$inc"]["user_story.total_point"] = branch.get("point", 0)
+        update["$set"]["scene.$[decision].selected_choice"] = branch["choice"]
+        array_filters = [{"decision.scene_id": body.choice.scene_id}]
+
+    if body.finished_time is not None:
+        update["$set"]["user_story.finished_time"] = body.finished_time
+
+    if body.status:
+        update["$set"]["status"] = body.status.value
+        if body.status == book_schema.book_status_enum.FINISHED:
+            update["$set"]["finished_at"] = datetime.utcnow()
+
+    # Optimistic concurrency, only applied when nobody wrote since the client read
+    result = await Book.find_one(
+        Book.id == _to_object_id(id),
+        Book.user_id == user_id,
+        _version_matches(body.version)
+    ).update(update, array_filters=array_filters)
+
+    if result.matched_count == 0:
+        book_version = await Book.find_one(Book.id == _to_object_id(id)).project(BookVersionView)
+        _check_book_owner(id, book_version, user_id)
+        raise HTTPException(status_code= 409, detail= f"book with id {id} was updated, current version is {book_version.version}")
+
+    analytic_cache.invalidate(user_id)
+
+    return {
+        "message": "successfully update book progress",
+        "data": {
+            "id": id,
+            "version": body.version + 1
+        }
+    }
+
+def _version_matches(version: int):
+    # Books saved before versioning have no version field, they read as version 0
+    if version == 0:
+        return Or(Book.version == 0, Exists(Book.version, False))
+    return Book.version == version
+
+async def _find_branch(id: str, choice: book_schema.progress_choice_schema, user_id: str) -> dict:
+    # Only the decision scene is projected, not the whole story
+    document = await Book.get_motor_collection().find_one(
+        {"_id": _to_object_id(id)},
+        {"user_id": 1, "version": 1, "scene": {"$elemMatch": {"scene_id": choice.scene_id}}}
+    )
+    book = BookSceneView(**document) if document else None
+    _check_book_owner(id, book, user_id)
+
+    scenes = book.scene or [{}]
+    for branch in scenes[0].get("branch") or []:
+        if branch.get("choice") == choice.choice:
+            return branch
+
+    raise HTTPException(status_code= 400, detail= f"scene {choice.scene_id} has no choice {choice.choice}")
+
+def _to_object_id(id: str) -> PydanticObjectId:
+    try:
+        return PydanticObjectId(id)
+    except Exception:
+        raise HTTPException(status_code= 404, detail= f"book with id {id} not found")
+
+def _check_book_owner(id: str, book, user_id: str):
     if not book:
         raise HTTPException(status_code= 404, detail= f"book with id {id} not found")
-    
-    user_id = current_user.get("id")
+
     if book.user_id != user_id:
         raise HTTPException(status_code= 403, detail= f"book with id {id} not belong to user with id ${user_id}")
 
+async def _generate_story_and_media(body: dict, voice_name_code: str):
+    tasks = []
+    started = set()
+    pending_scenes = []
+    characters = None
+    cover_img_description = None
+    book = None
+
+    def start(requests: list):
+        tasks.extend(asyncio.create_task(generate_image_or_voice(request)) for request in requests)
+
+    def start_cover():
+        if "cover" not in started and characters is not None and cover_img_description is not None:
+            started.add("cover")
+            start([_cover_media_request(characters, cover_img_description)])
+
+    def start_scene(scene: dict):
+        # Media is merged back by scene_id, a streamed scene without a usable one
+        # waits for the validated story, which numbers every scene
+        scene_id = scene.get("scene_id")
+        if isinstance(scene_id, int) and scene_id not in started:
+            started.add(scene_id)
+            start(_scene_media_requests(scene, characters, voice_name_code))
+
+    try:
+        async for event, data in stream_events(f"{book_stort_generation_url}/generate-story/stream", body):
+            if event == "characters":
+                characters = data
+                start_cover()
+                for scene in pending_scenes:
+                    start_scene(scene)
+                pending_scenes.clear()
+            elif event == "cover":
+                cover_img_description = data
+                start_cover()
+            elif event == "scene":
+                # Image prompts need the character descriptions, hold scenes until they arrive
+                if characters is None:
+                    pending_scenes.append(data)
+                else:
+                    start_scene(data)
+            elif event == "complete":
+                book = data
+            elif event == "error" and data.get("status_code") == 503:
+                raise HTTPException(
+                    status_code= 503,
+                    detail= f"story generation is at capacity, please retry later",
+                    headers= {"Retry-After": str(data.get("retry_after") or 10)}
+                )
+            elif event == "error":
+                raise HTTPException(status_code= 502, detail= f"story generation failed: {data.get('detail')}")
+
+        if book is None:
+            raise HTTPException(status_code= 502, detail= "story generation stream ended without a story")
+
+        # Start whatever the stream did not deliver on its own, from the validated story
+        characters = book.get("characters")
+        cover_img_description = book.get("cover_img_description")
+        start_cover()
+        for scene in book.get("scene"):
+            start_scene(scene)
+
+        result = await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't keep paying for media of a story that failed
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return book, result
+
+def _cover_media_request(characters: list, cover_img_description: str) -> dict:
     return {
-        "data": book
+        "scene_id": None,
+        "type": "cover_image",
+        "prompt": _add_character_description(
+            characters=characters,
+            img_description=cover_img_description
+        )
     }
 
+def _scene_media_requests(scene: dict, characters: list, voice_name_code: str) -> list:
+    return [
+        {
+            "scene_id": scene.get("scene_id"),
+            "type": "image",
+            "prompt": _add_character_description(
+                characters=characters,
+                img_description=scene.get("img_description")
+            )
+        },
+        {
+            "scene_id": scene.get("scene_id"),
+            "type": "voice",
+            "voice_name_code": voice_name_code,
+            "prompt": scene.get("content")
+        }
+    ]
+
 def _add_character_description(characters: list, img_description: str) -> str:
     prompt = f"description: {img_description}, cartoon style, this image is for kids, used for interactive book, be family friendly."
 
@@ -164,6 +433,17 @@ def _add_character_description(characters: list, img_description: str) -> str:
 
     return prompt
 
+def _encode_cursor(book: BookCardView) -> str:
+    raw = json.dumps({"created_at": book.created_at.isoformat(), "id": str(book.id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(raw["created_at"]), PydanticObjectId(raw["id"])
+    except Exception:
+        raise HTTPException(status_code= 400, detail= "invalid cursor")
+
 def _format_book_cards(books: list) -> list:
     book_cards = []
     for book in books:
@@ -173,7 +453,7 @@ def _format_book_cards(books: list) -> list:
             description= book.description,
             language= book.language,
             cover_img_url= book.cover_img_url,
-            estimation_time_to_read= _time_estimation_format(book.estimated_reading_time),
+            estimation_time_to_read= book.estimation_time_to_read or _time_estimation_format(book.estimated_reading_time),
             created_at= str(book.created_at)
         )
         book_cards.append(book_card)
@@ -1,8 +1,14 @@
 from models import User
+from utils.cache import user_profile_cache
 
 async def get_user_profile(current_user):
-    user = await User.get(current_user.get("id"))
-    return {
+    user_id = current_user.get("id")
+    profile = user_profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+
+    user = await User.get(user_id)
+    profile = {
         "data": {
             "id": str(user.id),
             "name": user.name,
@@ -10,4 +16,7 @@ async def get_user_profile(current_user):
             "auth": user.auth,
             "google_id": user.google_id
         }
-    }
\ No newline at end of file
+    }
+    user_profile_cache[user_id] = profile
+
+    return profile
@@ -1,6 +1,16 @@
+from fastapi import Response
+from typing import Optional
 from utils.ai.text_to_speech import AVAILABLE_VOICES
+from utils import http_cache
+
+# The voice list only changes with a deploy
+VOICES_ETAG = http_cache.content_etag(AVAILABLE_VOICES)
+
+def get_available_voice_model(current_user, response: Response, if_none_match: Optional[str] = None):
+    if http_cache.etag_matches(if_none_match, VOICES_ETAG):
+        return http_cache.not_modified(VOICES_ETAG, http_cache.VOICE_CACHE_CONTROL)
+    http_cache.set_cache_headers(response, VOICES_ETAG, http_cache.VOICE_CACHE_CONTROL)
 
-def get_available_voice_model(current_user):
     return {
         "data": AVAILABLE_VOICES
     }
\ No newline at end of file
@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError, HTTPException
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from exceptions import handler as exception_handler
+from middleware.compression_middleware import CompressionMiddleware
 from contextlib import asynccontextmanager
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
@@ -9,18 +10,31 @@ from setting.settings import settings
 from routes import routers
 from models.user import User
 from models.book import Book
+from models.rate_limit import RateLimitBucket
+from utils.mongo_index import ensure_indexes
+from utils.google_auth import google_keys
+from utils.response import ORJSONResponse
 import uvicorn
+import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     client = AsyncIOMotorClient(settings.MONGODB_URL)
+    document_models = [User,Book,RateLimitBucket]
     await init_beanie(
         database=client[settings.MONGODB_DB],
-        document_models=[User,Book],
+        document_models=document_models,
+        skip_indexes=True,
     )
+    await ensure_indexes(document_models)
+
+    google_keys_refresh = asyncio.create_task(google_keys.run_refresh_loop())
     yield
+    google_keys_refresh.cancel()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
 
 for router in routers:
     app.include_router(router)
@@ -1,2 +1,3 @@
 from .user import User
-from .book import Book
\ No newline at end of file
+from .book import Book
+from .rate_limit import RateLimitBucket
\ No newline at end of file
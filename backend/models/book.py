@@ -1,5 +1,6 @@
-from beanie import Document
-from pydantic import Field
+from beanie import Document, PydanticObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -21,6 +22,51 @@ class Book(Document):
     cover_img_url: Optional[str] = None
     description: str
     estimated_reading_time: int
+    estimation_time_to_read: Optional[str] = None
+    version: int = 0
 
     class Settings:
         name = "books"
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+            IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]),
+            IndexModel([("theme", ASCENDING)])
+        ]
+
+class BookCardView(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    title: str
+    language: str
+    description: str
+    cover_img_url: Optional[str] = None
+    estimated_reading_time: int
+    estimation_time_to_read: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class BookVersionView(BaseModel):
+    user_id: str
+    version: int = 0
+
+class BookSceneView(BaseModel):
+    user_id: str
+    version: int = 0
+    scene: list = []
+
+class LatestBookView(BaseModel):
+    age_group: int
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ActiveStoryView(BaseModel):
+    title: str
+    current_scene: int
+    total_scenes: Optional[int] = None
+    started_at: Optional[datetime] = None
+
+    class Settings:
+        projection = {
+            "title": 1,
+            "current_scene": 1,
+            "total_scenes": "$story_flow.total_scene",
+            "started_at": "$created_at"
+        }
@@ -0,0 +1,18 @@
+from beanie import Document
+from pymongo import ASCENDING, IndexModel
+from typing import Optional
+from datetime import datetime
+
+class RateLimitBucket(Document):
+    key: str
+    tokens: float
+    updated_at: float
+    expires_at: Optional[datetime] = None
+
+    class Settings:
+        name = "rate_limits"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            # A bucket left alone until it is full again holds no state worth keeping
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        ]
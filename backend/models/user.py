@@ -1,4 +1,5 @@
 from beanie import Document
+from pymongo import ASCENDING, IndexModel
 from pydantic import Field
 from typing import Optional
 from datetime import datetime
@@ -19,3 +20,7 @@ class User(Document):
 
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True),
+            IndexModel([("google_id", ASCENDING)])
+        ]
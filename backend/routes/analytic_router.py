@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, Query, Request
 from pydantic import BaseModel, Field
 from middleware.auth_middleware import get_current_user
-from handler.analytic_handler import chat_stream, get_analytic, get_concept_performance, get_overall_statistic, get_performance_timeline
+from utils.rate_limit import chat_stream_rate_limit
+from handler.analytic_handler import chat_stream, get_analytic, get_analytic_batch, get_concept_performance, get_overall_statistic, get_performance_timeline
+from schema.request.analytic_schema import analytic_batch_schema
 from typing import Optional
 
 router = APIRouter()
@@ -53,7 +55,17 @@ async def get_performance_timeline_route(
 async def get_overall_statistics_route(current_user=Depends(get_current_user)):
     return await get_overall_statistic(current_user)
 
-@router.post("/api/v1/chat/stream")
+@router.post("/api/v1/analytic/batch")
+async def get_analytic_batch_route(
+    body: analytic_batch_schema,
+    current_user=Depends(get_current_user)
+):
+    """
+    Answer several analytic metrics from a single book scan.
+    """
+    return await get_analytic_batch(current_user, body)
+
+@router.post("/api/v1/chat/stream", dependencies=[Depends(chat_stream_rate_limit)])
 async def chat_stream_route(
     request: ChatRequest,
     current_user=Depends(get_current_user),
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query
+from typing import Optional
 from middleware.auth_middleware import get_current_user
-from schema.request.book_schema import create_book_schema
+from utils.rate_limit import create_book_rate_limit
+from schema.request.book_schema import create_book_schema, update_progress_schema
 from handler import book_handler
 
 router = APIRouter()
 
-@router.post("/api/v1/book", status_code=201)
+@router.post("/api/v1/book", status_code=201, dependencies=[Depends(create_book_rate_limit)])
 async def register(
     body: create_book_schema,
     current_user = Depends(get_current_user)
@@ -14,13 +16,41 @@ async def register(
 
 @router.get("/api/v1/books", status_code=200)
 async def get_books(
+    limit: int = Query(20, ge=1, le=100, description="Number of books per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    if_none_match: Optional[str] = Header(None),
     current_user = Depends(get_current_user)
 ):
-    return await book_handler.get_books(current_user)
+    return await book_handler.get_books(current_user, limit, cursor, if_none_match)
 
 @router.get("/api/v1/book/{id}", status_code=200)
 async def get_book_by_id(
     id: str,
+    if_none_match: Optional[str] = Header(None),
     current_user = Depends(get_current_user)
 ):
-    return await book_handler.get_book_by_id(id,current_user)
+    return await book_handler.get_book_by_id(id, current_user, if_none_match)
+
+
+@router.get("/api/v1/book/{id}/scene/{scene_id}", status_code=200)
+async def get_book_scene(
+    id: str,
+    scene_id: int,
+    current_user = Depends(get_current_user)
+):
+    return await book_handler.get_book_scene(id, scene_id, current_user)
+
+@router.get("/api/v1/book/{id}/bundle", status_code=200)
+async def get_book_bundle(
+    id: str,
+    current_user = Depends(get_current_user)
+):
+    return await book_handler.get_book_bundle(id, current_user)
+
+@router.patch("/api/v1/book/{id}/progress", status_code=200)
+async def update_book_progress(
+    id: str,
+    body: update_progress_schema,
+    current_user = Depends(get_current_user)
+):
+    return await book_handler.update_book_progress(id, body, current_user)
\ No newline at end of file
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
+from typing import Optional
 from middleware.auth_middleware import get_current_user
 from handler.voice_handler import get_available_voice_model
 router = APIRouter()
 
 @router.get("/api/v1/voices")
-def get_voice_model(current_user=Depends(get_current_user)):
-    return get_available_voice_model(current_user)
\ No newline at end of file
+def get_voice_model(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user=Depends(get_current_user)
+):
+    return get_available_voice_model(current_user, response, if_none_match)
\ No newline at end of file
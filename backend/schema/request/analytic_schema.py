@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from enum import Enum
+
+class metric_type_enum(str, Enum):
+    CONCEPT_PERFORMANCE = "concept-performance"
+    PERFORMANCE_TIMELINE = "performance-timeline"
+    OVERALL_STATISTICS = "overall-statistics"
+
+class metric_spec_schema(BaseModel):
+    api_type: metric_type_enum
+    themes: Optional[List[str]] = None
+    time_unit: Optional[str] = None
+    num_periods: Optional[int] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+class analytic_batch_schema(BaseModel):
+    metrics: List[metric_spec_schema] = Field(..., min_length=1, max_length=10)
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Optional
 from enum import Enum
 
 class language_enum(str, Enum):
@@ -14,8 +15,23 @@ class language_enum(str, Enum):
 
 class create_book_schema(BaseModel):
     query: str
-    age: int
+    age: int = Field(..., ge=4, le=12, description="Age of the child, 4 to 12")
     voice_name_code: str = "en-US-JennyMultilingualNeural"
 
 class get_book_by_id_schema(BaseModel):
-    id: str
\ No newline at end of file
+    id: str
+
+class book_status_enum(str, Enum):
+    IN_PROGRESS = "in_progress"
+    FINISHED = "finished"
+
+class progress_choice_schema(BaseModel):
+    scene_id: int = Field(..., description="Decision point scene the choice was made in")
+    choice: str = Field(..., description="Label of the chosen branch, point comes from the book")
+
+class update_progress_schema(BaseModel):
+    version: int = Field(..., description="Book version the client last saw")
+    scene_id: int = Field(..., description="Scene the reader moved to")
+    choice: Optional[progress_choice_schema] = None
+    finished_time: Optional[int] = Field(None, ge=0, description="Total reading time in seconds")
+    status: Optional[book_status_enum] = None
\ No newline at end of file
@@ -11,9 +11,33 @@ class Settings(BaseSettings):
     FLUX_1_SCHNELL_API_KEY: str
     JWT_SECRET: str
     JWT_EXPIRED: int = 1
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 4
     GOOGLE_CLIENT_ID: str
     MICROSOFT_AZURE_BLOB_SAS_TOKEN: str
     MICROSOFT_AZURE_TEXT_TO_SPEECH_RESOURCE_KEY: str
+    ANALYTIC_CACHE_TTL: int = 300
+    ANALYTIC_CACHE_MAXSIZE: int = 1024
+    TOKEN_CACHE_MAXSIZE: int = 4096
+    PROFILE_CACHE_TTL: int = 60
+    PROFILE_CACHE_MAXSIZE: int = 1024
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    BOOK_BUNDLE_DIR: str = "./bundles"
+    BOOK_BUNDLE_DOWNLOAD_CONCURRENCY: int = 8
+    BOOK_BUNDLE_MAX_BYTES: int = 5 * 1024 ** 3
+    BOOK_BUNDLE_MAX_AGE: int = 7 * 24 * 3600
+    BOOK_BUNDLE_SWEEP_INTERVAL: int = 600
+    RATE_LIMIT_BACKEND: str = "memory"
+    BOOK_RATE_LIMIT_CAPACITY: int = 3
+    BOOK_RATE_LIMIT_PER_MINUTE: float = 0.5
+    BOOK_ROUTE_RATE_LIMIT_CAPACITY: int = 30
+    BOOK_ROUTE_RATE_LIMIT_PER_MINUTE: float = 10
+    CHAT_RATE_LIMIT_CAPACITY: int = 10
+    CHAT_RATE_LIMIT_PER_MINUTE: float = 6
+    CHAT_ROUTE_RATE_LIMIT_CAPACITY: int = 200
+    CHAT_ROUTE_RATE_LIMIT_PER_MINUTE: float = 120
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -1,4 +1,5 @@
 import json
+from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 import httpx
 from typing import Optional, Dict, Any
@@ -107,6 +108,43 @@ async def stream(ai_url: str, body: Optional[Dict[str, Any]] = None, headers: Op
     )
 
 
+async def stream_events(url: str, body: Optional[Dict[str, Any]] = None):
+    """
+    POST to a service answering with named SSE events.
+
+    Args:
+        url (str): The URL to send the request to.
+        body (Optional[Dict[str, Any]]): The JSON body to send with the request.
+
+    Yields:
+        tuple: (event name, parsed JSON data) for every event received.
+    """
+    timeout = httpx.Timeout(request_timeout, read=request_timeout)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async with client.stream("POST", url, json=body) as response:
+            if response.status_code == 503:
+                # Service at capacity, the client can retry like it would with us
+                raise HTTPException(
+                    status_code= 503,
+                    detail= "story generation is at capacity, please retry later",
+                    headers= {"Retry-After": response.headers.get("Retry-After", "10")}
+                )
+            if response.status_code >= 400:
+                error_text = await response.aread()
+                raise Exception(f"HTTP {response.status_code}: {error_text.decode()}")
+
+            # ": ping" keep-alive comments match none of the branches and are skipped
+            event, data = "message", []
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    yield event, json.loads("\n".join(data))
+                    event, data = "message", []
+
+
 def _handle_response(response: httpx.Response):
     if response.status_code >= 400:
         raise Exception(f"HTTP {response.status_code}: {response.text}")
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from weakref import WeakValueDictionary
+from urllib.parse import urlparse
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+import httpx
+from setting.settings import settings
+from utils.response import ORJSONResponse
+
+bundle_dir = settings.BOOK_BUNDLE_DIR
+download_timeout = 60.0  # 60 sec
+
+# One build per book at a time, concurrent requests wait and reuse the result
+_build_locks = WeakValueDictionary()
+
+# Bundles being served and book directories being built, never removed while pinned.
+# Eviction runs in a worker thread, hence a thread lock.
+_pins = Counter()
+_pins_lock = threading.RLock()
+_last_sweep = 0.0
+
+async def get_bundle_path(book) -> str:
+    """
+    Path of the zip holding the book JSON and all of its media.
+
+    Bundles are built on first request and kept on disk per book version, so
+    repeated and resumed (Range) downloads are served from the same file.
+    Media is downloaded once per book and reused when a progress update
+    bumps the version and only book.json changes.
+
+    The returned path is pinned until release(path), BundleResponse does
+    that once the download has finished.
+    """
+    book_id = str(book.id)
+    path = _bundle_path(book_id, book.version)
+    if _pin_existing(path):
+        await _maybe_sweep()
+        return path
+
+    lock = _build_locks.setdefault(book_id, asyncio.Lock())
+    async with lock:
+        if not _pin_existing(path):
+            directory = os.path.join(bundle_dir, book_id)
+            _pin(directory)
+            try:
+                media = _collect_media(book)
+                await _download_media(book_id, media)
+                await asyncio.to_thread(_write_bundle, book, media, path)
+                _pin(path)
+            finally:
+                release(directory)
+            _remove_stale_bundles(book_id)
+
+    await _maybe_sweep()
+    return path
+
+def release(path: str):
+    with _pins_lock:
+        _pins[path] -= 1
+        if _pins[path] <= 0:
+            del _pins[path]
+
+    if path.endswith(".zip"):
+        # An older version kept for this download can go now
+        _remove_stale_bundles(os.path.basename(os.path.dirname(path)))
+
+class BundleResponse(FileResponse):
+    """FileResponse that releases its bundle when sent, or when the client went away"""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            release(self.path)
+
+def _pin(path: str):
+    with _pins_lock:
+        _pins[path] += 1
+
+def _pin_existing(path: str) -> bool:
+    with _pins_lock:
+        if not os.path.exists(path):
+            return False
+        _pins[path] += 1
+
+    # Last use of the book for age / size based eviction
+    os.utime(path)
+    return True
+
+def _bundle_path(book_id: str, version: int) -> str:
+    return os.path.join(bundle_dir, book_id, f"{version}.zip")
+
+def _media_path(book_id: str, name: str) -> str:
+    return os.path.join(bundle_dir, book_id, "media", name)
+
+def _collect_media(book) -> dict:
+    """Archive name of every media file the book references, keyed by its URL"""
+    media = {}
+    if book.cover_img_url:
+        media[book.cover_img_url] = f"cover{_extension(book.cover_img_url)}"
+
+    for scene in book.scene:
+        scene_id = scene.get("scene_id")
+        img_url = scene.get("img_url")
+        voice_url = scene.get("voice_url")
+        if img_url:
+            media[img_url] = f"scene-{scene_id}-image{_extension(img_url)}"
+        if voice_url:
+            media[voice_url] = f"scene-{scene_id}-voice{_extension(voice_url)}"
+    return media
+
+def _extension(url: str) -> str:
+    return os.path.splitext(urlparse(url).path)[1]
+
+async def _download_media(book_id: str, media: dict):
+    os.makedirs(os.path.dirname(_media_path(book_id, "")), exist_ok=True)
+    semaphore = asyncio.Semaphore(settings.BOOK_BUNDLE_DOWNLOAD_CONCURRENCY)
+
+    async def download(client: httpx.AsyncClient, url: str, name: str):
+        path = _media_path(book_id, name)
+        if os.path.exists(path):
+            return
+
+        async with semaphore:
+            try:
+                async with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    with open(f"{path}.part", "wb") as f:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+            except httpx.HTTPError as e:
+                print(f"Bundle media download failed: {url} {e}")
+                raise HTTPException(status_code= 502, detail= f"failed to download book media {name}")
+        os.replace(f"{path}.part", path)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(download_timeout)) as client:
+        await asyncio.gather(*(download(client, url, name) for url, name in media.items()))
+
+def _write_bundle(book, media: dict, path: str):
+    book_id = str(book.id)
+    book_json = ORJSONResponse({"data": book}).body
+    manifest = ORJSONResponse({
+        "book_id": book_id,
+        "version": book.version,
+        "media": {url: f"media/{name}" for url, name in media.items()}
+    }).body
+
+    # Images and audio are stored as they are, only the JSON entries are deflated
+    with zipfile.ZipFile(f"{path}.part", "w", compression=zipfile.ZIP_STORED) as bundle:
+        bundle.writestr("book.json", book_json, compress_type=zipfile.ZIP_DEFLATED)
+        bundle.writestr("manifest.json", manifest, compress_type=zipfile.ZIP_DEFLATED)
+        for name in media.values():
+            bundle.write(_media_path(book_id, name), f"media/{name}")
+    os.replace(f"{path}.part", path)
+
+def _remove_stale_bundles(book_id: str):
+    """Remove zips of older versions, unless a download of them is still in progress"""
+    directory = os.path.join(bundle_dir, book_id)
+    with _pins_lock:
+        try:
+            versions = {
+                int(name[:-len(".zip")]): os.path.join(directory, name)
+                for name in os.listdir(directory)
+                if name.endswith(".zip")
+            }
+        except FileNotFoundError:
+            return
+
+        latest = max(versions, default=None)
+        for version, path in versions.items():
+            if version != latest and not _pins[path]:
+                os.remove(path)
+
+async def _maybe_sweep():
+    global _last_sweep
+    if time.time() - _last_sweep < settings.BOOK_BUNDLE_SWEEP_INTERVAL:
+        return
+    _last_sweep = time.time()
+    await asyncio.to_thread(_evict_bundles)
+
+def _evict_bundles():
+    """
+    Remove whole books (bundles and media), least recently used first, when
+    they weren't used for BOOK_BUNDLE_MAX_AGE or the directory is over
+    BOOK_BUNDLE_MAX_BYTES. Pinned books are skipped.
+    """
+    if not os.path.isdir(bundle_dir):
+        return
+
+    books = []
+    for name in os.listdir(bundle_dir):
+        directory = os.path.join(bundle_dir, name)
+        if ".evicting-" in name:
+            # Left over from an interrupted eviction
+            shutil.rmtree(directory, ignore_errors=True)
+        elif os.path.isdir(directory):
+            books.append((*_usage(directory), directory))
+
+    total = sum(size for _, size, _ in books)
+    cutoff = time.time() - settings.BOOK_BUNDLE_MAX_AGE
+    for last_used, size, directory in sorted(books):
+        if last_used >= cutoff and total <= settings.BOOK_BUNDLE_MAX_BYTES:
+            break
+        if _remove_unpinned(directory):
+            total -= size
+
+def _usage(directory: str) -> tuple:
+    last_used = os.path.getmtime(directory)
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            last_used = max(last_used, stat.st_mtime)
+    return last_used, size
+
+def _remove_unpinned(directory: str) -> bool:
+    with _pins_lock:
+        if any(path == directory or path.startswith(directory + os.sep) for path in _pins):
+            return False
+        # Renamed under the lock so no request can pin it any more, deleted outside of it
+        evicting = f"{directory}.evicting-{uuid.uuid4().hex}"
+        os.rename(directory, evicting)
+
+    shutil.rmtree(evicting, ignore_errors=True)
+    return True
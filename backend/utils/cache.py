@@ -0,0 +1,69 @@
+import itertools
+from cachetools import TTLCache
+from typing import Any, Hashable, Optional
+from setting.settings import settings
+
+class UserScopedCache:
+    """
+    TTL + LRU bounded cache whose entries belong to a user.
+
+    Every key carries the user's current generation, so invalidating a user is a
+    single counter bump: old entries can no longer be read and simply age out of
+    the LRU/TTL bounds. A value computed while an invalidation happens is stored
+    under the old generation and is never served.
+
+    Generations are bounded the same way as the entries. A user whose
+    generation was evicted gets a new, never used one, so an eviction can only
+    cost cache hits, never serve a stale entry.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._counter = itertools.count()
+
+    def key(self, user_id: str, name: str, params: Optional[dict] = None) -> tuple:
+        return (user_id, self._generation(user_id), name, _normalize_params(params or {}))
+
+    def get(self, key: tuple) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: tuple, value: Any):
+        self._cache[key] = value
+
+    def invalidate(self, user_id: str):
+        self._generations[user_id] = next(self._counter)
+
+    def _generation(self, user_id: str) -> int:
+        generation = self._generations.get(user_id)
+        if generation is None:
+            generation = self._generations[user_id] = next(self._counter)
+        return generation
+
+def _normalize_params(params: dict) -> tuple:
+    normalized = []
+    for name, value in params.items():
+        if value is None or value == "" or value == []:
+            continue
+        normalized.append((name, _normalize_value(value)))
+    return tuple(sorted(normalized))
+
+def _normalize_value(value: Any) -> Hashable:
+    if isinstance(value, str) and "," in value:
+        value = value.split(",")
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(str(item).strip() for item in value if str(item).strip()))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+analytic_cache = UserScopedCache(
+    maxsize=settings.ANALYTIC_CACHE_MAXSIZE,
+    ttl=settings.ANALYTIC_CACHE_TTL
+)
+
+# Formatted profile responses keyed by user id, dropped when the profile changes
+user_profile_cache = TTLCache(
+    maxsize=settings.PROFILE_CACHE_MAXSIZE,
+    ttl=settings.PROFILE_CACHE_TTL
+)
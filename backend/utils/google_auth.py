@@ -0,0 +1,94 @@
+import asyncio
+import re
+import time
+from typing import Optional
+from jose import jwt, JWTError
+import httpx
+from setting.settings import settings
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+ALGORITHM = "RS256"
+
+request_timeout = 10.0  # 10 sec
+default_max_age = 3600  # used when Google sends no max-age
+refresh_margin = 300  # refresh 5 minutes before the keys expire
+retry_interval = 30  # retry a failed refresh after 30 sec
+
+class GoogleKeyStore:
+    """
+    Google's ID token signing keys (JWKS) kept in memory.
+
+    Keys are refreshed in the background according to the max-age Google
+    sends with them, so sign-in only verifies the signature locally. A token
+    signed with a key we don't know yet (Google rotated early) triggers one
+    refresh before it is rejected.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        if kid not in self._keys or time.time() >= self._expires_at:
+            try:
+                # Unknown kids can't force more than one fetch per retry_interval
+                await self.refresh(min_interval=retry_interval)
+            except httpx.HTTPError as e:
+                print(f"Google signing keys refresh failed: {e}")
+        return self._keys.get(kid)
+
+    async def refresh(self, min_interval: float = 0):
+        async with self._lock:
+            # Requests waiting on the lock reuse the keys fetched before them
+            if time.time() - self._fetched_at < min_interval:
+                return
+
+            async with httpx.AsyncClient(timeout=httpx.Timeout(request_timeout)) as client:
+                response = await client.get(GOOGLE_CERTS_URL)
+                response.raise_for_status()
+
+            self._keys = {key["kid"]: key for key in response.json()["keys"]}
+            self._fetched_at = time.time()
+            self._expires_at = self._fetched_at + _max_age(response.headers.get("cache-control", ""))
+
+    async def run_refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+                delay = max(self._expires_at - time.time() - refresh_margin, retry_interval)
+            except Exception as e:
+                print(f"Google signing keys refresh failed: {e}")
+                delay = retry_interval
+            await asyncio.sleep(delay)
+
+def _max_age(cache_control: str) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return int(match.group(1)) if match else default_max_age
+
+google_keys = GoogleKeyStore()
+
+async def verify_google_id_token(token: str) -> Optional[dict]:
+    """Claims of a valid Google ID token issued for this app, None otherwise"""
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+    except JWTError:
+        return None
+
+    key = await google_keys.get_key(kid)
+    if key is None:
+        return None
+
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[ALGORITHM],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=GOOGLE_ISSUERS,
+            options={"verify_at_hash": False}
+        )
+    except JWTError:
+        return None
@@ -1,13 +1,36 @@
+import asyncio
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
+from concurrent.futures import ThreadPoolExecutor
+from setting.settings import settings
 
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM
+)
 
-def hash(plain_password: str) -> str:
-    return ph.hash(plain_password)
+# argon2-cffi releases the GIL while hashing, so threads run in parallel and
+# the pool size bounds how many CPU cores logins can take at once
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="argon2"
+)
 
-def compare(plain_password: str, hashed_password: str) -> bool:
+async def hash(plain_password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, ph.hash, plain_password)
+
+async def compare(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _verify, plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with other parameters than the configured ones"""
+    return ph.check_needs_rehash(hashed_password)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
     try:
         return ph.verify(hashed_password, plain_password)
     except VerifyMismatchError:
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,33 @@
+from fastapi import Response
+from typing import Optional
+import hashlib
+import json
+
+BOOK_CACHE_CONTROL = "private, no-cache"
+LIBRARY_CACHE_CONTROL = "private, no-cache"
+VOICE_CACHE_CONTROL = "private, max-age=86400"
+
+def version_etag(resource_id: str, version: int) -> str:
+    return f'W/"{resource_id}-{version}"'
+
+def content_etag(content) -> str:
+    raw = content if isinstance(content, bytes) else json.dumps(content, sort_keys=True, default=str).encode()
+    return f'W/"{hashlib.sha1(raw).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+def set_cache_headers(response: Response, etag: str, cache_control: str):
+    response.headers.update(cache_headers(etag, cache_control))
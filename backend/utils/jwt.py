@@ -1,12 +1,22 @@
 from jose import jwt, JWTError
+from cachetools import TLRUCache
 from datetime import datetime, timedelta
 from setting.settings import settings
 from models import User
+import hashlib
+import time
 
 JWT_SECRET = settings.JWT_SECRET
 ALGORITHM = "HS256"
 JWT_EXPIRED = 60 * settings.JWT_EXPIRED
 
+# Verified payloads keyed by token hash, each entry expires with its token's exp
+_verified_tokens = TLRUCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttu=lambda _key, payload, _now: payload["exp"],
+    timer=time.time
+)
+
 def create_access_token(user: User):
     data = {
         "id": str(user.id),
@@ -23,9 +33,14 @@ def create_access_token(user: User):
     return jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
 
 def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        payload['token'] = token
-        return payload
-    except JWTError:
-        return None
\ No newline at end of file
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _verified_tokens.get(key)
+
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        _verified_tokens[key] = payload
+
+    return {**payload, "token": token}
@@ -0,0 +1,45 @@
+from beanie import Document
+from pymongo.errors import OperationFailure
+from typing import List, Type
+
+async def ensure_indexes(document_models: List[Type[Document]]) -> list:
+    """
+    Build the indexes declared in each model's Settings.indexes, then report the ones still missing.
+
+    Indexes are built one by one so a single failing build (e.g. duplicate emails
+    blocking the unique index) is reported instead of stopping the startup.
+    """
+    for model in document_models:
+        collection = model.get_motor_collection()
+        for index in _declared_indexes(model):
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                print(f"Failed to build index {_index_keys(index)} on {collection.name}: {e}")
+
+    missing = await find_missing_indexes(document_models)
+    for collection_name, keys in missing:
+        print(f"Missing index {keys} on {collection_name}")
+    if not missing:
+        print("All declared indexes are present")
+
+    return missing
+
+async def find_missing_indexes(document_models: List[Type[Document]]) -> list:
+    missing = []
+    for model in document_models:
+        collection = model.get_motor_collection()
+        index_information = await collection.index_information()
+        existing = {tuple(info["key"]) for info in index_information.values()}
+
+        for index in _declared_indexes(model):
+            keys = _index_keys(index)
+            if keys not in existing:
+                missing.append((collection.name, keys))
+    return missing
+
+def _declared_indexes(model: Type[Document]) -> list:
+    return getattr(model.Settings, "indexes", [])
+
+def _index_keys(index) -> tuple:
+    return tuple(index.document["key"].items())
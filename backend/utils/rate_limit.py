@@ -0,0 +1,139 @@
+import math
+import time
+from datetime import datetime, timedelta
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from middleware.auth_middleware import get_current_user
+from models.rate_limit import RateLimitBucket
+from setting.settings import settings
+
+class MemoryBucketBackend:
+    """Token buckets kept in the worker's memory, limits apply per worker"""
+
+    def __init__(self, maxsize: int = 100_000, ttl: int = 24 * 3600):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def take(self, key: str, capacity: int, refill_rate: float) -> float:
+        now = time.time()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / refill_rate
+
+        self._buckets[key] = (tokens - 1, now)
+        return 0
+
+    async def refund(self, key: str, capacity: int):
+        tokens, updated_at = self._buckets.get(key, (capacity, time.time()))
+        self._buckets[key] = (min(capacity, tokens + 1), updated_at)
+
+class MongoBucketBackend:
+    """
+    Token buckets shared by every worker through the rate_limits collection.
+
+    Refill and take happen in one pipeline update on the bucket document, so
+    concurrent requests from several workers can't spend the same token.
+    """
+
+    async def take(self, key: str, capacity: int, refill_rate: float) -> float:
+        now = time.time()
+        refilled = {"$min": [
+            capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, refill_rate]}
+            ]}
+        ]}
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {
+                "allowed": {"$gte": ["$tokens", 1]},
+                "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": datetime.utcnow() + timedelta(seconds=capacity / refill_rate)
+            }}
+        ]
+
+        collection = RateLimitBucket.get_motor_collection()
+        try:
+            bucket = await collection.find_one_and_update(
+                {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Two workers created the same bucket at once, the loser retries as an update
+            bucket = await collection.find_one_and_update(
+                {"key": key}, pipeline, return_document=ReturnDocument.AFTER
+            )
+
+        if bucket["allowed"]:
+            return 0
+        return (1 - bucket["tokens"]) / refill_rate
+
+    async def refund(self, key: str, capacity: int):
+        await RateLimitBucket.get_motor_collection().update_one(
+            {"key": key},
+            [{"$set": {"tokens": {"$min": [capacity, {"$add": ["$tokens", 1]}]}}}]
+        )
+
+_backends = {
+    "memory": MemoryBucketBackend,
+    "mongo": MongoBucketBackend
+}
+
+bucket_backend = _backends[settings.RATE_LIMIT_BACKEND]()
+
+def rate_limit(
+    name: str,
+    capacity: int,
+    per_minute: float,
+    route_capacity: int,
+    route_per_minute: float
+):
+    """
+    Dependency limiting a route with two token buckets.
+
+    The per-user bucket keeps one account (or a client stuck in a loop) to its
+    own share, the per-route bucket caps everybody together so the paid
+    upstream quota is never exceeded. When the route bucket denies, the
+    user's token is given back so a global 429 doesn't drain their share.
+    A denied request gets 429 with the seconds until a token is available
+    in Retry-After.
+    """
+
+    async def check_rate_limit(current_user = Depends(get_current_user)):
+        user_id = current_user.get("id")
+
+        user_key = f"{name}:user:{user_id}"
+        retry_after = await bucket_backend.take(user_key, capacity, per_minute / 60)
+        if not retry_after:
+            retry_after = await bucket_backend.take(f"{name}:route", route_capacity, route_per_minute / 60)
+            if retry_after:
+                await bucket_backend.refund(user_key, capacity)
+
+        if retry_after:
+            raise HTTPException(
+                status_code= 429,
+                detail= f"too many requests to {name}, retry in {math.ceil(retry_after)} seconds",
+                headers= {"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    return check_rate_limit
+
+create_book_rate_limit = rate_limit(
+    "create-book",
+    capacity= settings.BOOK_RATE_LIMIT_CAPACITY,
+    per_minute= settings.BOOK_RATE_LIMIT_PER_MINUTE,
+    route_capacity= settings.BOOK_ROUTE_RATE_LIMIT_CAPACITY,
+    route_per_minute= settings.BOOK_ROUTE_RATE_LIMIT_PER_MINUTE
+)
+
+chat_stream_rate_limit = rate_limit(
+    "chat-stream",
+    capacity= settings.CHAT_RATE_LIMIT_CAPACITY,
+    per_minute= settings.CHAT_RATE_LIMIT_PER_MINUTE,
+    route_capacity= settings.CHAT_ROUTE_RATE_LIMIT_CAPACITY,
+    route_per_minute= settings.CHAT_ROUTE_RATE_LIMIT_PER_MINUTE
+)
@@ -0,0 +1,28 @@
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from bson import ObjectId
+from typing import Any
+import orjson
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Pydantic models, Beanie documents included, are dumped straight to JSON by
+    pydantic-core and embedded as is, so a book never goes through an
+    intermediate dict. Returning this response from a handler also skips
+    FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        # by_alias keeps Beanie's "_id", same as jsonable_encoder
+        return orjson.Fragment(obj.model_dump_json(by_alias=True))
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")